@@ -0,0 +1,129 @@
+"""Download repo archive and extract it in one streaming pass."""
+
+import asyncio
+import hashlib
+import io
+import tarfile
+from pathlib import PurePosixPath
+from typing import Optional
+from urllib.parse import quote
+
+from aiohttp import ClientError, ClientSession, StreamReader
+from aux_utils import CHUNK_SIZE, SHA256
+from link_extractor import TraversalStats, parse_contents_url, resolve_ref
+from loggers import log_hash, logger
+from sync_index import mirror_path
+
+
+class StreamBridge(io.RawIOBase):
+    """Blocking file-like view of response stream for worker thread."""
+
+    def __init__(
+        self,
+        content: StreamReader,
+        loop: asyncio.AbstractEventLoop,
+    ) -> None:
+        """Wrap response content read from given event loop."""
+        super().__init__()
+        self._content = content
+        self._loop = loop
+
+    def readable(self) -> bool:
+        """Return True, stream is readable."""
+        return True
+
+    def readinto(self, buffer: bytearray) -> int:  # type: ignore[override]
+        """Read next chunk of response into buffer."""
+        chunk = asyncio.run_coroutine_threadsafe(
+            self._content.read(len(buffer)),
+            self._loop,
+        ).result()
+        chunk_len = len(chunk)
+        buffer[:chunk_len] = chunk
+        return chunk_len
+
+
+def _member_path(member_name: str, dir_path: str) -> Optional[str]:
+    """Return repo path of archive member inside given repo directory.
+
+    Path is relative to repo root, as in files mode.
+    """
+    repo_path = '/'.join(PurePosixPath(member_name).parts[1:])
+    prefix = '{0}/'.format(dir_path) if dir_path else ''
+    if not repo_path.startswith(prefix):
+        return None
+    return repo_path
+
+
+def extract_archive(
+    fileobj: io.RawIOBase,
+    directory: str,
+    dir_path: str = '',
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """Extract regular files of tar.gz stream, logging their hashes.
+
+    Archive top-level directory is stripped, only members under dir_path
+    are extracted, keeping their repo paths. Return number of extracted
+    files.
+    """
+    file_count = 0
+    with tarfile.open(fileobj=fileobj, mode='r|gz') as tar:
+        for member in tar:
+            rel_path = _member_path(member.name, dir_path)
+            if not member.isfile() or not rel_path:
+                continue
+            path_to_file = mirror_path(directory, rel_path)
+            path_to_file.parent.mkdir(parents=True, exist_ok=True)
+            in_file = tar.extractfile(member)
+            if in_file is None:
+                continue
+            hasher = hashlib.sha256()
+            with open(path_to_file, 'bw') as out_file:
+                chunk = in_file.read(chunk_size)
+                while chunk:
+                    hasher.update(chunk)
+                    out_file.write(chunk)
+                    chunk = in_file.read(chunk_size)
+            log_hash(path_to_file, {SHA256: hasher.hexdigest()})
+            file_count += 1
+    return file_count
+
+
+async def fetch_archive(
+    url: str,
+    directory: str,
+    session: ClientSession,
+) -> int:
+    """Stream archive of repo directory given by contents API URL.
+
+    Archive is never staged on disk: extraction runs in worker thread
+    reading response chunks as they arrive. Return number of files.
+    """
+    location = parse_contents_url(url)
+    ref = await resolve_ref(location, session, TraversalStats())
+    if ref is None:
+        return 0
+    archive_url = '{0}/archive/{1}.tar.gz'.format(
+        location.api_url,
+        quote(ref, safe=''),
+    )
+    msg = 'Processing: {0}'.format(archive_url)
+    logger.info(msg)
+    loop = asyncio.get_running_loop()
+    try:
+        async with session.get(archive_url, raise_for_status=True) as resp:
+            bridge = StreamBridge(resp.content, loop)
+            file_count = await loop.run_in_executor(
+                None,
+                extract_archive,
+                bridge,
+                directory,
+                location.path,
+            )
+    except (ClientError, OSError, ValueError, tarfile.TarError) as err:
+        logger.error('Error occured.')
+        return 0
+    msg = '{0} files extracted.'.format(file_count)
+    logger.info(msg)
+    return file_count
@@ -1,15 +1,112 @@
-"""Provide file hash calculation function."""
+"""Provide file hash calculation functions."""
 import hashlib
+import mmap
+import os
+import threading
+from typing import Iterable, Optional, Union
 
 CHUNK_SIZE: int = 1024 * 1024  # one megabyte
+MMAP_THRESHOLD: int = 64 * CHUNK_SIZE
+SHA256: str = 'sha256'
+GIT_BLOB_SHA1: str = 'git-blob-sha1'
+ALGORITHMS: tuple = (SHA256, 'sha1', GIT_BLOB_SHA1, 'blake2b', 'md5')
+
+_local = threading.local()
+
+
+def git_blob_header(size: int) -> bytes:
+    """Return header git prepends to content when computing blob id."""
+    return 'blob {0}\0'.format(size).encode()
+
+
+class MultiHasher:
+    """Feed same data to several hash algorithms in one pass.
+
+    Git blob SHA-1 covers header with content size, so size must be
+    known up front to use it.
+    """
+
+    def __init__(
+        self,
+        algorithms: Iterable[str] = (SHA256,),
+        size: Optional[int] = None,
+    ) -> None:
+        """Create hashers for given algorithms."""
+        self.hashers: dict = {}
+        for algorithm in algorithms:
+            if algorithm not in ALGORITHMS:
+                err_msg = 'Unknown hash algorithm: {0}'.format(algorithm)
+                raise ValueError(err_msg)
+            if algorithm == GIT_BLOB_SHA1:
+                if size is None:
+                    raise ValueError('Git blob SHA-1 needs content size.')
+                hasher = hashlib.sha1(usedforsecurity=False)
+                hasher.update(git_blob_header(size))
+            else:
+                hasher = hashlib.new(algorithm, usedforsecurity=False)
+            self.hashers[algorithm] = hasher
+
+    def update(self, chunk: bytes) -> None:
+        """Feed chunk to every hasher."""
+        for hasher in self.hashers.values():
+            hasher.update(chunk)
+
+    def hexdigests(self) -> dict:
+        """Return hex digest by algorithm name."""
+        return {
+            algorithm: hasher.hexdigest()
+            for algorithm, hasher in self.hashers.items()
+        }
+
+
+def _read_buffer(chunk_size: int) -> memoryview:
+    """Return read buffer reused by calls made in current thread."""
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None or len(buffer) != chunk_size:
+        buffer = bytearray(chunk_size)
+        _local.buffer = buffer
+    return memoryview(buffer)
+
+
+def update_hash(
+    hasher: Union['hashlib._Hash', MultiHasher],
+    path_to_file: str,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """Feed file content to hasher, return number of bytes read.
+
+    Large files are memory mapped, others are read into per-thread
+    buffer, so no new bytes object is allocated per chunk.
+    """
+    with open(path_to_file, 'br', buffering=0) as in_file:
+        fileno = in_file.fileno()
+        if os.fstat(fileno).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    for offset in range(0, len(view), chunk_size):
+                        hasher.update(view[offset:offset + chunk_size])
+                return len(mapped)
+        buffer = _read_buffer(chunk_size)
+        nbytes = 0
+        chunk_len = in_file.readinto(buffer)
+        while chunk_len:
+            hasher.update(buffer[:chunk_len])
+            nbytes += chunk_len
+            chunk_len = in_file.readinto(buffer)
+    return nbytes
+
+
+def hash_file(
+    path_to_file: str,
+    algorithms: Iterable[str] = (SHA256,),
+    chunk_size: int = CHUNK_SIZE,
+) -> dict:
+    """Calculate hashes of file with all given algorithms in one pass."""
+    hasher = MultiHasher(algorithms, os.stat(path_to_file).st_size)
+    update_hash(hasher, path_to_file, chunk_size)
+    return hasher.hexdigests()
 
 
 def get_hash(path_to_file: str, chunk_size: int = CHUNK_SIZE) -> str:
     """Calculate hash of file correspond to given filepath."""
-    with open(path_to_file, 'br') as in_file:
-        hasher = hashlib.sha256()
-        chunk = in_file.read(chunk_size)
-        while chunk:
-            hasher.update(chunk)
-            chunk = in_file.read(chunk_size)
-    return hasher.hexdigest()
+    return hash_file(path_to_file, (SHA256,), chunk_size)[SHA256]
@@ -0,0 +1,390 @@
+"""Sync many repos listed in manifest under one concurrency budget."""
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import tempfile
+from contextlib import AsyncExitStack
+from pathlib import Path
+from typing import AsyncIterator, NamedTuple, Optional
+
+from aiohttp import ClientError, ClientSession
+from blob_store import LINK_MODES, BlobStore
+from client_config import ClientConfig
+from downloader import HashOptions
+from http_cache import HttpCache
+from limiter import BudgetedLimiter, FairBudget
+from link_extractor import DISCOVERY_BACKENDS, parse_contents_url
+from loggers import configure_logging, flush_logging, logger
+from main import (
+    LOG_LEVELS,
+    add_client_arguments,
+    client_config_from_args,
+    sync_repo,
+)
+from manifest import checksum_line
+from scheduler import run_pool
+from sync_index import SyncIndex, mirror_path
+from yarl import URL
+
+BUDGET: int = 32
+REPO_CONCURRENCY: int = 8
+MANIFEST_SUFFIX: str = '.sha256'
+
+
+class BatchEntry(NamedTuple):
+    """Repo directory and ref to sync, name is used for output paths."""
+
+    url: str
+    name: str
+    ref: Optional[str] = None
+
+    @property
+    def host(self) -> str:
+        """Return origin of repo host."""
+        return str(URL(self.url).origin())
+
+    @property
+    def ref_url(self) -> str:
+        """Return contents API URL pointing at ref."""
+        if not self.ref:
+            return self.url
+        return str(URL(self.url).update_query(ref=self.ref))
+
+
+def entry_name(url: str, ref: Optional[str] = None) -> str:
+    """Return default name of repo: host, owner, repo, ref and path."""
+    location = parse_contents_url(url)
+    api_url = URL(location.api_url)
+    name_parts = [api_url.host or 'localhost', *api_url.parts[-2:]]
+    ref = ref or location.ref
+    if ref:
+        name_parts[-1] = '{0}@{1}'.format(name_parts[-1], ref)
+    if location.path:
+        name_parts.append(location.path)
+    return '/'.join(name_parts)
+
+
+def check_names(names: list) -> None:
+    """Raise if entries share name or mirror of one would nest in another."""
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        err_msg = 'Duplicate batch entry names: {0}'.format(
+            ', '.join(duplicates),
+        )
+        logger.error(err_msg)
+        raise ValueError(err_msg)
+    nested = sorted(
+        name
+        for name in names
+        if any(name.startswith('{0}/'.format(other)) for other in names)
+    )
+    if nested:
+        err_msg = 'Batch entry names nested in others: {0}'.format(
+            ', '.join(nested),
+        )
+        logger.error(err_msg)
+        raise ValueError(err_msg)
+
+
+def load_manifest(path: str) -> list:
+    """Load batch entries from JSON list of URLs or url/ref/name objects."""
+    with open(path) as in_file:
+        raw_entries = json.load(in_file)
+    entries = []
+    for raw_entry in raw_entries:
+        if isinstance(raw_entry, str):
+            raw_entry = {'url': raw_entry}
+        unknown_fields = set(raw_entry) - set(BatchEntry._fields)
+        if 'url' not in raw_entry or unknown_fields:
+            err_msg = 'Bad batch manifest entry: {0}'.format(raw_entry)
+            logger.error(err_msg)
+            raise ValueError(err_msg)
+        name = raw_entry.get('name') or entry_name(
+            raw_entry['url'],
+            raw_entry.get('ref'),
+        )
+        entries.append(
+            BatchEntry(raw_entry['url'], name, raw_entry.get('ref')),
+        )
+    check_names([batch_entry.name for batch_entry in entries])
+    return entries
+
+
+def write_hash_manifest(path_to_file: Path, index: SyncIndex) -> None:
+    """Write sha256sum-style manifest of indexed files atomically."""
+    path_to_file.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path_to_file.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w') as out_file:
+        for repo_path, entry in sorted(index.entries.items()):
+            out_file.write(checksum_line(entry.sha256, repo_path))
+    os.replace(tmp_name, path_to_file)
+
+
+def host_config(config: ClientConfig, budget: int) -> ClientConfig:
+    """Return client config of single host sharing given budget.
+
+    Host limit starts at configured concurrency and adapts up to the
+    whole budget, which bounds all hosts together. Connection pool of
+    host is sized for that limit.
+    """
+    return dataclasses.replace(
+        config,
+        adaptive=True,
+        max_concurrency=max(config.download_slots, budget),
+    )
+
+
+class BatchSync:
+    """Shared sessions, host limiters and budget of single batch run.
+
+    Every host gets own session with connection pool and own adaptive
+    limiter shared by all its repos, every download also takes slot of
+    global budget handed to hosts round-robin.
+    """
+
+    def __init__(
+        self,
+        config: ClientConfig,
+        output_dir: str,
+        budget: int = BUDGET,
+        mirror_root: Optional[str] = None,
+        store: Optional[BlobStore] = None,
+        hash_options: HashOptions = HashOptions(),
+        discovery: str = 'contents',
+        http_cache: Optional[HttpCache] = None,
+    ) -> None:
+        """Prepare batch run, sessions are opened on first use."""
+        self.config = config
+        self.output_dir = output_dir
+        self.budget = FairBudget(budget)
+        self.host_config = host_config(config, self.budget.limit)
+        self.mirror_root = mirror_root
+        self.store = store
+        self.hash_options = hash_options
+        self.discovery = discovery
+        self.http_cache = http_cache
+        self.failed: list = []
+        self._sessions: dict = {}
+        self._limiters: dict = {}
+        self._exit_stack = AsyncExitStack()
+
+    async def __aenter__(self) -> 'BatchSync':
+        """Enter context closing sessions on exit."""
+        await self._exit_stack.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        """Close sessions of all hosts."""
+        await self._exit_stack.__aexit__(*exc_info)
+
+    async def session(self, host: str) -> ClientSession:
+        """Return session of given host."""
+        if host not in self._sessions:
+            self._sessions[host] = await self._exit_stack.enter_async_context(
+                self.host_config.make_session(),
+            )
+        return self._sessions[host]
+
+    def limiter(self, host: str) -> BudgetedLimiter:
+        """Return limiter of given host bound to global budget."""
+        if host not in self._limiters:
+            self._limiters[host] = BudgetedLimiter(
+                self.host_config.make_limiter(),
+                self.budget,
+                host,
+            )
+        return self._limiters[host]
+
+    async def sync_entry(self, batch_entry: BatchEntry) -> None:
+        """Sync single repo and write its hash manifest.
+
+        Failure of one repo is logged and does not stop others.
+        """
+        msg = 'Syncing {0}'.format(batch_entry.name)
+        logger.info(msg)
+        try:
+            if self.mirror_root is None:
+                with tempfile.TemporaryDirectory() as tempdir:
+                    index = SyncIndex(tempdir)
+                    synced = await self._sync_to_index(batch_entry, index)
+            else:
+                index = SyncIndex.load(
+                    str(mirror_path(self.mirror_root, batch_entry.name)),
+                )
+                try:
+                    synced = await self._sync_to_index(batch_entry, index)
+                finally:
+                    index.save()
+            manifest_name = batch_entry.name + MANIFEST_SUFFIX
+            write_hash_manifest(
+                mirror_path(self.output_dir, manifest_name),
+                index,
+            )
+        except (ClientError, OSError, ValueError) as err:
+            msg = 'Sync of {0} failed: {1!r}'.format(batch_entry.name, err)
+            logger.error(msg)
+            synced = False
+        if not synced:
+            self.failed.append(batch_entry.name)
+
+    async def _sync_to_index(
+        self,
+        batch_entry: BatchEntry,
+        index: SyncIndex,
+    ) -> bool:
+        stats, summary = await sync_repo(
+            batch_entry.ref_url,
+            index.directory,
+            await self.session(batch_entry.host),
+            self.config,
+            index,
+            self.discovery,
+            self.hash_options,
+            self.store,
+            self.limiter(batch_entry.host),
+            self.http_cache,
+        )
+        index.prune(delete_files=not stats.errors)
+        return not stats.errors and not summary.failed
+
+    async def run(
+        self,
+        entries: list,
+        repo_concurrency: int = REPO_CONCURRENCY,
+    ) -> int:
+        """Sync given entries, return number of synced repos."""
+
+        async def jobs() -> AsyncIterator[BatchEntry]:  # noqa: WPS430
+            for batch_entry in entries:
+                yield batch_entry
+
+        return await run_pool(jobs(), self.sync_entry, repo_concurrency)
+
+
+async def main(
+    entries: list,
+    output_dir: str,
+    config: Optional[ClientConfig] = None,
+    budget: int = BUDGET,
+    repo_concurrency: int = REPO_CONCURRENCY,
+    **options: object,
+) -> list:
+    """Sync all entries, return names of failed repos.
+
+    Repo fails if it can not be synced, its discovery had errors or
+    any of its files could not be downloaded.
+    Other options are passed to BatchSync.
+    """
+    if config is None:
+        config = ClientConfig()
+    async with BatchSync(config, output_dir, budget, **options) as batch:
+        repo_count = await batch.run(entries, repo_concurrency)
+    msg = '{0} repos synced, {1} with errors.'.format(
+        repo_count,
+        len(batch.failed),
+    )
+    logger.info(msg)
+    return batch.failed
+
+
+def make_parser(
+    description: Optional[str] = __doc__,
+) -> argparse.ArgumentParser:
+    """Return parser of manifest, output, mirror and client options."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        'manifest',
+        help='JSON list of contents API URLs or url/ref/name objects',
+    )
+    parser.add_argument(
+        '--output',
+        metavar='DIR',
+        required=True,
+        help='write per-repo hash manifests to DIR',
+    )
+    parser.add_argument(
+        '--mirror-root',
+        metavar='DIR',
+        help='keep persistent mirror of every repo under DIR',
+    )
+    parser.add_argument(
+        '--store',
+        metavar='DIR',
+        help='keep every unique blob of all repos once in DIR',
+    )
+    parser.add_argument(
+        '--http-cache',
+        metavar='DIR',
+        help='cache API listings in DIR and request them conditionally',
+    )
+    parser.add_argument(
+        '--link-mode',
+        choices=LINK_MODES,
+        default=LINK_MODES[0],
+        help='how files are made from stored blobs, copy is fallback',
+    )
+    parser.add_argument(
+        '--budget',
+        type=int,
+        default=BUDGET,
+        help='concurrent downloads of all hosts, one host may take all',
+    )
+    parser.add_argument(
+        '--repo-concurrency',
+        type=int,
+        default=REPO_CONCURRENCY,
+        help='number of repos synced concurrently',
+    )
+    parser.add_argument(
+        '--discovery',
+        choices=sorted(DISCOVERY_BACKENDS),
+        default='contents',
+        help='list files per directory or with recursive git trees API',
+    )
+    parser.add_argument(
+        '--log-level',
+        choices=LOG_LEVELS,
+        default='INFO',
+        help='level of log messages',
+    )
+    add_client_arguments(parser)
+    return parser
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    return make_parser().parse_args(argv)
+
+
+def options_from_args(args: argparse.Namespace) -> dict:
+    """Return BatchSync options given on command line."""
+    return {
+        'mirror_root': args.mirror_root,
+        'store': BlobStore(args.store, args.link_mode) if args.store else None,
+        'discovery': args.discovery,
+        'http_cache': HttpCache(args.http_cache) if args.http_cache else None,
+    }
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    configure_logging(getattr(logging, args.log_level), hash_stream=None)
+    try:
+        failed = asyncio.run(main(
+            load_manifest(args.manifest),
+            args.output,
+            client_config_from_args(args),
+            args.budget,
+            args.repo_concurrency,
+            **options_from_args(args),
+        ))
+    except KeyboardInterrupt:
+        logger.warning('Interrupted.')
+        raise SystemExit(130)
+    finally:
+        flush_logging()
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,78 @@
+"""Compare per-file and archive download modes by repo file count.
+
+Run from script directory: python -m benchmarks.bench_archive
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import time
+
+from aiohttp.test_utils import TestServer
+from archive import fetch_archive
+from benchmarks.gitea_stub import CONTENTS_PATH, create_repo_app
+from benchmarks.synthetic import latency_middleware
+from client_config import ClientConfig
+from loggers import configure_logging
+from main import sync_repo
+
+FILE_COUNTS: tuple = (1, 5, 10, 25, 50, 100, 250, 500)
+
+
+def make_files(file_count: int, file_size: int, fan_out: int = 10) -> dict:
+    """Return synthetic tree with given number of files."""
+    return {
+        'dir{0}/file{1}.txt'.format(num % fan_out, num): bytes(file_size)
+        for num in range(file_count)
+    }
+
+
+async def measure(file_count: int, args: argparse.Namespace) -> dict:
+    """Time both download modes on tree of given size."""
+    app = create_repo_app(make_files(file_count, args.file_size))
+    app.middlewares.append(latency_middleware(args.latency))
+    timings = {'files': file_count}
+    config = ClientConfig(
+        concurrency=args.concurrency,
+        dir_concurrency=args.concurrency,
+    )
+    async with TestServer(app) as server:
+        url = str(server.make_url(CONTENTS_PATH))
+        for mode in ('per_file', 'archive'):
+            with tempfile.TemporaryDirectory() as tempdir:
+                async with config.make_session() as session:
+                    started = time.perf_counter()
+                    if mode == 'archive':
+                        await fetch_archive(url, tempdir, session)
+                    else:
+                        await sync_repo(url, tempdir, session, config)
+                    timings[mode] = round(time.perf_counter() - started, 4)
+    return timings
+
+
+async def run(args: argparse.Namespace) -> None:
+    """Print timings for every file count and crossover point."""
+    crossover = None
+    for file_count in FILE_COUNTS:
+        timings = await measure(file_count, args)
+        print(json.dumps(timings))  # noqa: WPS421
+        if crossover is None and timings['archive'] < timings['per_file']:
+            crossover = file_count
+    print(json.dumps({'crossover_file_count': crossover}))  # noqa: WPS421
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse benchmark options."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--file-size', type=int, default=4096)
+    parser.add_argument('--concurrency', type=int, default=3)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    cli_args = parse_args()
+    configure_logging(logging.WARNING, hash_stream=None)
+    asyncio.run(run(cli_args))
@@ -0,0 +1,241 @@
+"""Benchmark discovery, downloads and hashing against synthetic server.
+
+Run from script directory: python -m benchmarks.bench_pipeline
+Every client setting runs in fresh subprocess together with its own
+server, so peak RSS is the peak of that run alone. It covers both
+sides, server holding whole tree in memory included, so it is
+comparable between settings of the same tree, not a client footprint.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from aiohttp.test_utils import TestServer
+from benchmarks.gitea_stub import CONTENTS_PATH
+from benchmarks.synthetic import (
+    NetworkProfile,
+    TreeShape,
+    create_synthetic_app,
+    make_tree,
+)
+from client_config import ClientConfig
+from downloader import DownloadResult
+from hashing import engine
+from link_extractor import DISCOVERY_BACKENDS, traverse_repo
+from loggers import configure_logging
+from main import run_tasks
+
+DISCOVERY_ENDPOINTS: tuple = ('contents', 'repo', 'trees')
+MEGABYTE: int = 1024 * 1024
+
+
+def peak_rss() -> int:
+    """Return peak resident set size of this process in bytes.
+
+    Peak never goes down, so it is meaningful in fresh process only.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+
+def rates(file_count: int, nbytes: int, seconds: float) -> dict:
+    """Return throughput of single phase."""
+    seconds = max(seconds, 1e-9)
+    return {
+        'seconds': round(seconds, 4),
+        'files_per_sec': round(file_count / seconds, 2),
+        'mb_per_sec': round(nbytes / MEGABYTE / seconds, 3),
+    }
+
+
+def round_trips(hits: Counter) -> int:
+    """Return number of discovery requests served."""
+    return sum(hits[endpoint] for endpoint in DISCOVERY_ENDPOINTS)
+
+
+async def run_benchmark(
+    shape: TreeShape,
+    profile: NetworkProfile,
+    config: ClientConfig,
+    discovery: str = 'contents',
+) -> dict:
+    """Run discovery, download and hashing phases, return measurements.
+
+    Discovery is timed alone with traverse_repo, download phase streams
+    freshly discovered files into run_tasks like sync_repo does, hashing
+    phase rehashes downloaded files with shared engine.
+    """
+    files = make_tree(shape)
+    total_bytes = sum(len(content) for content in files.values())
+    hits: Counter = Counter()
+    app = create_synthetic_app(files, profile, hits)
+    report = {
+        'concurrency': config.concurrency,
+        'adaptive': config.adaptive,
+        'discovery_backend': discovery,
+        'files': len(files),
+        'bytes': total_bytes,
+    }
+    async with TestServer(app) as server:
+        url = str(server.make_url(CONTENTS_PATH))
+        async with config.make_session() as session:
+            started = time.perf_counter()
+            links, stats = await traverse_repo(
+                url,
+                session,
+                config.dir_concurrency,
+                discovery,
+            )
+            report['discovery'] = {
+                'seconds': round(time.perf_counter() - started, 4),
+                'files': len(links),
+                'round_trips': round_trips(hits),
+                'errors': stats.errors,
+            }
+            with tempfile.TemporaryDirectory() as tempdir:
+                paths: list = []
+
+                def on_result(download_result: DownloadResult) -> None:
+                    if download_result.ok:
+                        paths.append(str(download_result.path))
+
+                hits.clear()
+                walk = DISCOVERY_BACKENDS[discovery]
+                started = time.perf_counter()
+                summary = await run_tasks(
+                    walk(url, session, config.dir_concurrency),
+                    tempdir,
+                    session,
+                    config.make_limiter(),
+                    on_result=on_result,
+                )
+                report['download'] = {
+                    **rates(
+                        summary.downloaded,
+                        summary.bytes_downloaded,
+                        time.perf_counter() - started,
+                    ),
+                    'failed': summary.failed,
+                    'round_trips': round_trips(hits),
+                    'file_requests': hits['raw'],
+                }
+                started = time.perf_counter()
+                list(engine.hash_files(paths))
+                report['hashing'] = rates(
+                    len(paths),
+                    summary.bytes_downloaded,
+                    time.perf_counter() - started,
+                )
+    report['peak_rss_mb'] = round(peak_rss() / MEGABYTE, 1)
+    return report
+
+
+def run_isolated(
+    shape: TreeShape,
+    profile: NetworkProfile,
+    config: ClientConfig,
+    discovery: str = 'contents',
+) -> dict:
+    """Run benchmark in fresh process, return its measurements."""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(1, mp_context=context) as executor:
+        return executor.submit(
+            run_in_subprocess,
+            shape,
+            profile,
+            config,
+            discovery,
+        ).result()
+
+
+def run_in_subprocess(
+    shape: TreeShape,
+    profile: NetworkProfile,
+    config: ClientConfig,
+    discovery: str,
+) -> dict:
+    """Configure logging of subprocess and run benchmark in it."""
+    configure_logging(logging.WARNING, hash_stream=None)
+    return asyncio.run(run_benchmark(shape, profile, config, discovery))
+
+
+def run(args: argparse.Namespace) -> list:
+    """Run benchmark for every concurrency setting, each in own process."""
+    shape = TreeShape(
+        args.depth,
+        args.fan_out,
+        args.files,
+        args.file_size,
+        args.size_sigma,
+        args.seed,
+    )
+    profile = NetworkProfile(
+        args.latency,
+        args.bandwidth,
+        args.error_rate,
+        args.seed,
+    )
+    reports = []
+    for concurrency in args.concurrency:
+        config = ClientConfig(
+            concurrency=concurrency,
+            adaptive=args.adaptive,
+            dir_concurrency=args.dir_concurrency,
+        )
+        report = run_isolated(shape, profile, config, args.discovery)
+        print(json.dumps(report))  # noqa: WPS421
+        reports.append(report)
+    return reports
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    """Parse benchmark options."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    shape = parser.add_argument_group('tree shape')
+    shape.add_argument('--depth', type=int, default=2)
+    shape.add_argument('--fan-out', type=int, default=4)
+    shape.add_argument('--files', type=int, default=200)
+    shape.add_argument('--file-size', type=int, default=16 * 1024)
+    shape.add_argument('--size-sigma', type=float, default=1.0)
+    network = parser.add_argument_group('network')
+    network.add_argument('--latency', type=float, default=0.02)
+    network.add_argument(
+        '--bandwidth',
+        type=int,
+        default=0,
+        help='bytes per second per response, 0 is unlimited',
+    )
+    network.add_argument('--error-rate', type=float, default=0)
+    client = parser.add_argument_group('client')
+    client.add_argument('--concurrency', type=int, nargs='+', default=[3])
+    client.add_argument('--adaptive', action='store_true')
+    client.add_argument('--dir-concurrency', type=int, default=8)
+    client.add_argument(
+        '--discovery',
+        choices=sorted(DISCOVERY_BACKENDS),
+        default='contents',
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON reports to file')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    cli_args = parse_args()
+    configure_logging(logging.WARNING, hash_stream=None)
+    benchmark_reports = run(cli_args)
+    if cli_args.output:
+        with open(cli_args.output, 'w') as out_file:
+            json.dump(benchmark_reports, out_file, indent=2)
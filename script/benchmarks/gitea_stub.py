@@ -0,0 +1,195 @@
+"""Minimal Gitea API stand-in serving in-memory repo tree."""
+
+import hashlib
+import io
+import tarfile
+from collections import Counter
+from typing import Optional
+
+from aiohttp import web
+
+REPO_API_PATH: str = '/api/v1/repos/owner/repo'
+CONTENTS_PATH: str = '{0}/contents/'.format(REPO_API_PATH)
+
+
+def blob_sha(content: bytes) -> str:
+    """Return git blob id of given content."""
+    header = 'blob {0}\0'.format(len(content)).encode()
+    return hashlib.sha1(header + content).hexdigest()  # noqa: S324
+
+
+def _children(files: dict, dir_path: str) -> dict:
+    prefix = '{0}/'.format(dir_path) if dir_path else ''
+    children: dict = {}
+    for file_path in files:
+        if not file_path.startswith(prefix):
+            continue
+        name, _, rest = file_path[len(prefix):].partition('/')
+        children[name] = 'dir' if rest else 'file'
+    return children
+
+
+def _dir_sha(files: dict, dir_path: str) -> str:
+    prefix = '{0}/'.format(dir_path) if dir_path else ''
+    hasher = hashlib.sha1()  # noqa: S324
+    for file_path in sorted(files):
+        if file_path.startswith(prefix):
+            hasher.update(file_path.encode())
+            hasher.update(blob_sha(files[file_path]).encode())
+    return hasher.hexdigest()
+
+
+def _entry(
+    request: web.Request,
+    files: dict,
+    path: str,
+    obj_type: str,
+) -> dict:
+    origin = str(request.url.origin())
+    is_file = obj_type == 'file'
+    download_url = None
+    if is_file:
+        download_url = '{0}/owner/repo/raw/branch/master/{1}'.format(
+            origin,
+            path,
+        )
+    return {
+        'name': path.rpartition('/')[2],
+        'path': path,
+        'sha': blob_sha(files[path]) if is_file else _dir_sha(files, path),
+        'type': obj_type,
+        'size': len(files[path]) if is_file else 0,
+        'url': '{0}{1}{2}?ref=master'.format(origin, CONTENTS_PATH, path),
+        'download_url': download_url,
+    }
+
+
+def _listing(
+    request: web.Request,
+    files: dict,
+    dir_path: str,
+    hits: Counter,
+) -> web.Response:
+    children = _children(files, dir_path)
+    if not children:
+        raise web.HTTPNotFound()
+    etag = '"{0}"'.format(_dir_sha(files, dir_path))
+    if request.headers.get('If-None-Match') == etag:
+        hits['not_modified'] += 1
+        return web.Response(status=304, headers={'ETag': etag})
+    prefix = '{0}/'.format(dir_path) if dir_path else ''
+    return web.json_response([
+        _entry(request, files, prefix + name, obj_type)
+        for name, obj_type in sorted(children.items())
+    ], headers={'ETag': etag})
+
+
+def _tree_entry(files: dict, path: str, obj_type: str) -> dict:
+    is_blob = obj_type == 'blob'
+    return {
+        'path': path,
+        'mode': '100644' if is_blob else '040000',
+        'type': obj_type,
+        'size': len(files[path]) if is_blob else 0,
+        'sha': blob_sha(files[path]) if is_blob else _dir_sha(files, path),
+    }
+
+
+def _tree(files: dict) -> list:
+    dirs = {
+        file_path.rpartition('/')[0]
+        for file_path in files
+        if '/' in file_path
+    }
+    for dir_path in list(dirs):
+        while '/' in dir_path:
+            dir_path = dir_path.rpartition('/')[0]
+            dirs.add(dir_path)
+    entries = [_tree_entry(files, path, 'tree') for path in dirs]
+    entries.extend(_tree_entry(files, path, 'blob') for path in files)
+    return sorted(entries, key=lambda tree_entry: tree_entry['path'])
+
+
+def _tree_page(files: dict, page: int, per_page: int, paged: bool) -> dict:
+    entries = _tree(files)
+    if not paged:
+        return {
+            'tree': entries[:per_page],
+            'truncated': per_page < len(entries),
+        }
+    start = (page - 1) * per_page
+    return {
+        'sha': _dir_sha(files, ''),
+        'tree': entries[start:start + per_page],
+        'truncated': start + per_page < len(entries),
+        'page': page,
+        'total_count': len(entries),
+    }
+
+
+def make_archive(files: dict, top_dir: str = 'repo') -> bytes:
+    """Return tar.gz archive of tree as served by Gitea."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for file_path, content in sorted(files.items()):
+            member = tarfile.TarInfo('{0}/{1}'.format(top_dir, file_path))
+            member.size = len(content)
+            tar.addfile(member, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def create_repo_app(
+    files: dict,
+    hits: Optional[Counter] = None,
+    tree_page_size: int = 1000,
+    paged: bool = True,
+) -> web.Application:
+    """Return app serving contents API and raw files for given tree.
+
+    Served requests are counted by endpoint in hits counter. Git trees
+    API pages are capped at tree_page_size entries like Gitea does,
+    without paging only first page is served as truncated tree.
+    Directory listings carry ETag and honor If-None-Match.
+    """
+    if hits is None:
+        hits = Counter()
+
+    async def contents(request: web.Request) -> web.Response:  # noqa: WPS430
+        hits['contents'] += 1
+        path = request.match_info['path'].strip('/')
+        if path in files:
+            return web.json_response(_entry(request, files, path, 'file'))
+        return _listing(request, files, path, hits)
+
+    async def raw(request: web.Request) -> web.Response:  # noqa: WPS430
+        hits['raw'] += 1
+        content = files.get(request.match_info['path'])
+        if content is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=content)
+
+    async def repo_info(request: web.Request) -> web.Response:  # noqa: WPS430
+        hits['repo'] += 1
+        return web.json_response({'default_branch': 'master'})
+
+    async def trees(request: web.Request) -> web.Response:  # noqa: WPS430
+        hits['trees'] += 1
+        page = int(request.query.get('page', 1))
+        per_page = min(int(request.query.get('per_page', 1)), tree_page_size)
+        return web.json_response(_tree_page(files, page, per_page, paged))
+
+    async def archive(request: web.Request) -> web.Response:  # noqa: WPS430
+        hits['archive'] += 1
+        return web.Response(
+            body=make_archive(files),
+            content_type='application/gzip',
+        )
+
+    app = web.Application()
+    app.router.add_get(CONTENTS_PATH + '{path:.*}', contents)
+    app.router.add_get('/owner/repo/raw/branch/master/{path:.*}', raw)
+    app.router.add_get(REPO_API_PATH, repo_info)
+    app.router.add_get(REPO_API_PATH + '/git/trees/{ref}', trees)
+    app.router.add_get(REPO_API_PATH + '/raw/{path:.*}', raw)
+    app.router.add_get(REPO_API_PATH + '/archive/{archive}', archive)
+    return app
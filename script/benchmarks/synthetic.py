@@ -0,0 +1,162 @@
+"""Synthetic Gitea server with configurable tree and network conditions."""
+
+import asyncio
+import random
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from aiohttp import web
+from benchmarks.gitea_stub import create_repo_app
+
+BANDWIDTH_CHUNK: int = 16 * 1024
+SERVICE_UNAVAILABLE: int = 503
+VALIDATOR_HEADERS: tuple = ('ETag', 'Last-Modified')
+
+
+@dataclass(frozen=True)
+class TreeShape:
+    """Shape of synthetic repo tree.
+
+    Every directory up to given depth has fan_out subdirectories. Files
+    are spread over all directories round-robin, their sizes follow
+    log-normal distribution around mean_size, zero sigma means fixed size.
+    """
+
+    depth: int = 2
+    fan_out: int = 4
+    file_count: int = 100
+    mean_size: int = 16 * 1024
+    size_sigma: float = 1.0
+    seed: int = 0
+
+    def dir_paths(self) -> list:
+        """Return paths of all directories, root first."""
+        dir_paths = ['']
+        level = ['']
+        for _ in range(self.depth):
+            level = [
+                '{0}{1}d{2}'.format(parent, '/' if parent else '', num)
+                for parent in level
+                for num in range(self.fan_out)
+            ]
+            dir_paths.extend(level)
+        return dir_paths
+
+    def file_size(self, rnd: random.Random) -> int:
+        """Return size of next file."""
+        if not self.size_sigma:
+            return self.mean_size
+        return int(rnd.lognormvariate(0, self.size_sigma) * self.mean_size)
+
+
+def make_tree(shape: TreeShape) -> dict:
+    """Return file contents by path for tree of given shape."""
+    rnd = random.Random(shape.seed)  # noqa: S311
+    dir_paths = shape.dir_paths()
+    files = {}
+    for num in range(shape.file_count):
+        dir_path = dir_paths[num % len(dir_paths)]
+        file_path = '{0}{1}file{2}.bin'.format(
+            dir_path,
+            '/' if dir_path else '',
+            num,
+        )
+        files[file_path] = rnd.randbytes(shape.file_size(rnd))
+    return files
+
+
+@dataclass(frozen=True)
+class NetworkProfile:
+    """Latency, bandwidth and error rate injected by synthetic server.
+
+    Latency delays every response. Bandwidth in bytes per second caps
+    every single raw file response, zero means unlimited. Error rate is
+    share of raw file requests answered with 503.
+    """
+
+    latency: float = 0.02
+    bandwidth: int = 0
+    error_rate: float = 0
+    seed: int = 0
+
+
+def latency_middleware(latency: float) -> Callable:
+    """Return middleware delaying every response by given seconds."""
+
+    @web.middleware
+    async def delay(request: web.Request, handler: Callable) -> web.Response:
+        await asyncio.sleep(latency)
+        return await handler(request)
+
+    return delay
+
+
+def error_middleware(error_rate: float, seed: int = 0) -> Callable:
+    """Return middleware failing given share of raw file requests."""
+    rnd = random.Random(seed)  # noqa: S311
+
+    @web.middleware
+    async def fail(request: web.Request, handler: Callable) -> web.Response:
+        if '/raw/' in request.path and rnd.random() < error_rate:
+            return web.Response(
+                status=SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '0'},
+            )
+        return await handler(request)
+
+    return fail
+
+
+def bandwidth_middleware(bandwidth: int) -> Callable:
+    """Return middleware streaming response bodies at given bytes/sec.
+
+    Validators are passed on, so conditional requests work as without it.
+    """
+
+    @web.middleware
+    async def throttle(
+        request: web.Request,
+        handler: Callable,
+    ) -> web.StreamResponse:
+        response = await handler(request)
+        body = getattr(response, 'body', None)
+        if not isinstance(body, bytes):
+            return response
+        headers = {
+            name: response.headers[name]
+            for name in VALIDATOR_HEADERS
+            if name in response.headers
+        }
+        throttled = web.StreamResponse(
+            status=response.status,
+            headers={**headers, 'Content-Type': response.content_type},
+        )
+        throttled.content_length = len(body)
+        await throttled.prepare(request)
+        for offset in range(0, len(body), BANDWIDTH_CHUNK):
+            chunk = body[offset:offset + BANDWIDTH_CHUNK]
+            await throttled.write(chunk)
+            await asyncio.sleep(len(chunk) / bandwidth)
+        await throttled.write_eof()
+        return throttled
+
+    return throttle
+
+
+def create_synthetic_app(
+    files: dict,
+    profile: NetworkProfile,
+    hits: Optional[Counter] = None,
+) -> web.Application:
+    """Return Gitea stand-in serving files under given network profile."""
+    app = create_repo_app(files, hits)
+    if profile.latency:
+        app.middlewares.append(latency_middleware(profile.latency))
+    if profile.error_rate:
+        app.middlewares.append(
+            error_middleware(profile.error_rate, profile.seed),
+        )
+    if profile.bandwidth:
+        app.middlewares.append(bandwidth_middleware(profile.bandwidth))
+    return app
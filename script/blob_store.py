@@ -0,0 +1,149 @@
+"""Keep content-addressed store of downloaded blobs."""
+
+import asyncio
+import errno
+import os
+import shutil
+import stat
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from loggers import logger
+
+HARDLINK: str = 'hardlink'
+REFLINK: str = 'reflink'
+COPY: str = 'copy'
+LINK_MODES: tuple = (HARDLINK, REFLINK, COPY)
+FICLONE: int = 0x40049409
+READ_ONLY: int = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+
+def reflink(source: Path, target: Path) -> None:
+    """Clone file sharing its extents, supported by copy-on-write fs only."""
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks need Linux.')
+    import fcntl  # noqa: WPS433
+
+    with open(source, 'rb') as in_file, open(target, 'wb') as out_file:
+        fcntl.ioctl(out_file.fileno(), FICLONE, in_file.fileno())
+
+
+def _sharded(root: Path, digest: str) -> Path:
+    return root / digest[:2] / digest[2:]
+
+
+class BlobStore:
+    """Store holding every unique blob once, keyed by sha256.
+
+    Git blob sha of stored file is mapped to its sha256 by small ref
+    file, so blob listed by server is found without download or hashing.
+    Files are materialized in repo layout by hardlink, reflink or copy,
+    falling back to copy when preferred link can not be made. Stored
+    objects are read-only, so are hardlinked mirror files sharing them:
+    mirror updates replace files by rename and never write in place.
+    """
+
+    def __init__(self, root: str, link_mode: str = HARDLINK) -> None:
+        """Create store in given directory."""
+        if link_mode not in LINK_MODES:
+            err_msg = 'Unknown link mode: {0}'.format(link_mode)
+            logger.error(err_msg)
+            raise ValueError(err_msg)
+        self.root = Path(root)
+        self.link_mode = link_mode
+        self._pending: dict = {}
+
+    def object_path(self, sha256: str) -> Path:
+        """Return path of blob with given sha256."""
+        return _sharded(self.root / 'objects', sha256)
+
+    def ref_path(self, blob_sha: str) -> Path:
+        """Return path of ref file of given git blob sha."""
+        return _sharded(self.root / 'refs', blob_sha)
+
+    def lookup(self, blob_sha: str) -> Optional[str]:
+        """Return sha256 of stored blob with given git blob sha."""
+        try:
+            sha256 = self.ref_path(blob_sha).read_text().strip()
+        except OSError:
+            return None
+        if not self.object_path(sha256).is_file():
+            return None
+        return sha256
+
+    def materialize(self, sha256: str, path_to_file: Path) -> int:
+        """Put stored blob to given path, replacing it. Return size."""
+        object_path = self.object_path(sha256)
+        path_to_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path_to_file.with_name(
+            '{0}.{1}.tmp'.format(path_to_file.name, os.getpid()),
+        )
+        tmp_path.unlink(missing_ok=True)
+        try:
+            self._link(object_path, tmp_path)
+            os.replace(tmp_path, path_to_file)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return object_path.stat().st_size
+
+    def add(
+        self,
+        path_to_file: Path,
+        sha256: str,
+        blob_sha: Optional[str] = None,
+    ) -> None:
+        """Store downloaded file, deduplicating it against stored copy."""
+        object_path = self.object_path(sha256)
+        if object_path.is_file():
+            self.materialize(sha256, path_to_file)
+        else:
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=object_path.parent)
+            os.close(fd)
+            os.unlink(tmp_name)
+            try:
+                self._link(path_to_file, Path(tmp_name))
+                os.chmod(tmp_name, READ_ONLY)
+                os.replace(tmp_name, object_path)
+            finally:
+                Path(tmp_name).unlink(missing_ok=True)
+        if blob_sha:
+            self._write_ref(blob_sha, sha256)
+
+    async def wait(self, blob_sha: str) -> None:
+        """Wait until blob being downloaded by another task is stored."""
+        while blob_sha in self._pending:
+            await self._pending[blob_sha].wait()
+
+    def reserve(self, blob_sha: str) -> None:
+        """Mark blob as being downloaded, so others wait for it."""
+        self._pending[blob_sha] = asyncio.Event()
+
+    def release(self, blob_sha: str) -> None:
+        """Wake tasks waiting for blob, stored or not."""
+        event = self._pending.pop(blob_sha, None)
+        if event is not None:
+            event.set()
+
+    def _link(self, source: Path, target: Path) -> None:
+        if self.link_mode != COPY:
+            try:
+                if self.link_mode == HARDLINK:
+                    os.link(source, target)
+                else:
+                    reflink(source, target)
+            except OSError:
+                target.unlink(missing_ok=True)
+            else:
+                return
+        shutil.copyfile(source, target)
+
+    def _write_ref(self, blob_sha: str, sha256: str) -> None:
+        ref_path = self.ref_path(blob_sha)
+        ref_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=ref_path.parent)
+        with os.fdopen(fd, 'w') as out_file:
+            out_file.write(sha256)
+        os.replace(tmp_name, ref_path)
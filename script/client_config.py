@@ -0,0 +1,117 @@
+"""Configure HTTP client shared by discovery and downloads."""
+
+import dataclasses
+import json
+from dataclasses import dataclass
+from typing import Optional
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from limiter import AdaptiveLimiter
+from link_extractor import DIR_CONCURRENCY
+from loggers import logger
+from metrics import make_trace_config
+
+
+@dataclass(frozen=True)
+class ClientConfig:
+    """Connection pool, timeout and concurrency settings.
+
+    Zero pool limits are derived from concurrency, so every concurrent
+    download and directory listing gets its own warm connection. In
+    adaptive mode concurrency is the starting download limit.
+    """
+
+    concurrency: int = 3
+    adaptive: bool = False
+    max_concurrency: int = 32
+    dir_concurrency: int = DIR_CONCURRENCY
+    limit: int = 0
+    limit_per_host: int = 0
+    keepalive_timeout: float = 30
+    use_dns_cache: bool = True
+    ttl_dns_cache: Optional[int] = 300
+    total_timeout: Optional[float] = None
+    connect_timeout: Optional[float] = 30
+    sock_read_timeout: Optional[float] = 60
+    compression: bool = True
+
+    @property
+    def download_slots(self) -> int:
+        """Return highest possible number of concurrent downloads."""
+        if self.adaptive:
+            return max(self.max_concurrency, self.concurrency)
+        return self.concurrency
+
+    @property
+    def pool_limit(self) -> int:
+        """Return total connection pool size."""
+        return self.limit or self.download_slots + self.dir_concurrency
+
+    @property
+    def pool_limit_per_host(self) -> int:
+        """Return connection pool size for single host."""
+        return self.limit_per_host or self.pool_limit
+
+    def make_limiter(self) -> AdaptiveLimiter:
+        """Return download limiter, fixed unless adaptive mode is on."""
+        min_limit = 1 if self.adaptive else self.concurrency
+        return AdaptiveLimiter(
+            self.concurrency,
+            min_limit,
+            self.download_slots,
+        )
+
+    def make_connector(self) -> TCPConnector:
+        """Return connector with configured pool and DNS cache."""
+        return TCPConnector(
+            limit=self.pool_limit,
+            limit_per_host=self.pool_limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=self.use_dns_cache,
+            ttl_dns_cache=self.ttl_dns_cache,
+        )
+
+    def make_timeout(self) -> ClientTimeout:
+        """Return request timeouts."""
+        return ClientTimeout(
+            total=self.total_timeout,
+            sock_connect=self.connect_timeout,
+            sock_read=self.sock_read_timeout,
+        )
+
+    def make_session(self) -> ClientSession:
+        """Return session using configured connector and timeouts.
+
+        Requests made by session are traced into metrics registry.
+        """
+        encoding = 'gzip, deflate' if self.compression else 'identity'
+        return ClientSession(
+            connector=self.make_connector(),
+            timeout=self.make_timeout(),
+            headers={'Accept-Encoding': encoding},
+            auto_decompress=self.compression,
+            trace_configs=[make_trace_config()],
+        )
+
+    def replace(self, **changes: object) -> 'ClientConfig':
+        """Return copy with given fields changed, None values are ignored."""
+        return dataclasses.replace(self, **{
+            field_name: field_value
+            for field_name, field_value in changes.items()
+            if field_value is not None
+        })
+
+
+def load_client_config(path: str) -> ClientConfig:
+    """Load client config from JSON file with ClientConfig field names."""
+    with open(path) as in_file:
+        raw_config = json.load(in_file)
+    known_fields = {field.name for field in dataclasses.fields(ClientConfig)}
+    unknown_fields = set(raw_config) - known_fields
+    if unknown_fields:
+        err_msg = 'Unknown client config fields: {0}'.format(
+            ', '.join(sorted(unknown_fields)),
+        )
+        logger.error(err_msg)
+        raise ValueError(err_msg)
+    return ClientConfig(**raw_config)
@@ -0,0 +1,465 @@
+"""Download single file with retries, resuming from partial file."""
+
+import asyncio
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Mapping, Optional, Tuple
+
+from aiofile import async_open
+from aiohttp import ClientError, ClientResponseError, ClientSession
+from aux_utils import (
+    CHUNK_SIZE,
+    GIT_BLOB_SHA1,
+    SHA256,
+    MultiHasher,
+    update_hash,
+)
+from limiter import TOO_MANY_REQUESTS, Limiter, parse_retry_after
+from loggers import file_logger
+from metrics import SIZE_BUCKETS, registry
+
+MAX_ATTEMPTS: int = 5
+BACKOFF_BASE: float = 0.5
+BACKOFF_MAX: float = 30
+PART_SUFFIX: str = '.part'
+VALIDATOR_SUFFIX: str = '.meta'
+PARTIAL_CONTENT: int = 206
+RANGE_NOT_SATISFIABLE: int = 416
+REQUEST_TIMEOUT: int = 408
+SERVER_ERROR: int = 500
+
+
+class ContentMismatchError(ValueError):
+    """Downloaded content is not the file listed by server."""
+
+
+class SizeMismatchError(ContentMismatchError):
+    """Downloaded file size differs from size advertised by server."""
+
+
+class BlobMismatchError(ContentMismatchError):
+    """Git blob id of downloaded file differs from one listed by server."""
+
+    def __init__(self, message: str, resumed: bool) -> None:
+        """Remember if mismatched content was resumed from partial file."""
+        super().__init__(message)
+        self.resumed = resumed
+
+
+@dataclass(frozen=True)
+class HashOptions:
+    """Algorithms computed while downloading and git blob id check.
+
+    SHA-256 is always computed. Git blob SHA-1 needs file size from
+    server listing and is skipped for files without it.
+    """
+
+    algorithms: Tuple[str, ...] = (SHA256,)
+    verify_blob: bool = False
+
+    def for_size(self, size: Optional[int]) -> Tuple[str, ...]:
+        """Return algorithms usable for file of given size."""
+        algorithms = [SHA256, *self.algorithms]
+        if self.verify_blob:
+            algorithms.append(GIT_BLOB_SHA1)
+        if size is None:
+            algorithms = [
+                algorithm for algorithm in algorithms
+                if algorithm != GIT_BLOB_SHA1
+            ]
+        return tuple(dict.fromkeys(algorithms))
+
+    def with_blob_sha(self) -> 'HashOptions':
+        """Return options computing git blob SHA-1 too, not verifying it."""
+        return replace(self, algorithms=(*self.algorithms, GIT_BLOB_SHA1))
+
+
+@dataclass
+class DownloadResult:
+    """Outcome of single file download.
+
+    Cached result stands for file found up to date in sync index, blob
+    sha is the one listed by server.
+    """
+
+    url: str
+    path: Path
+    sha256: Optional[str] = None
+    size: int = 0
+    attempts: int = 0
+    resumed_from: int = 0
+    error: Optional[str] = None
+    hashes: dict = field(default_factory=dict)
+    blob_mismatch: bool = False
+    from_store: bool = False
+    cached: bool = False
+    blob_sha: Optional[str] = None
+    timings: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        """Return True if file was downloaded completely."""
+        return self.error is None and self.sha256 is not None
+
+
+@dataclass
+class PartialFile:
+    """Partially downloaded file with hashes of content written so far.
+
+    Validator is strong ETag or Last-Modified of response the content
+    came from, it is kept with blob sha in file next to partial file.
+    """
+
+    path: Path
+    algorithms: Tuple[str, ...] = (SHA256,)
+    size: Optional[int] = None
+    offset: int = 0
+    blob_sha: Optional[str] = None
+    validator: Optional[str] = None
+    hasher: MultiHasher = field(init=False)
+    resumed: bool = field(default=False, init=False)
+    write_seconds: float = field(default=0, init=False)
+    hash_seconds: float = field(default=0, init=False)
+
+    def __post_init__(self) -> None:
+        """Start hashing from scratch."""
+        self.hasher = MultiHasher(self.algorithms, self.size)
+
+    @property
+    def validator_path(self) -> Path:
+        """Return path of file with validator and blob sha."""
+        return self.path.with_name(self.path.name + VALIDATOR_SUFFIX)
+
+    def restart(self) -> None:
+        """Drop downloaded content, next request starts from scratch."""
+        self.offset = 0
+        self.validator = None
+        self.resumed = False
+        self.hasher = MultiHasher(self.algorithms, self.size)
+
+    def save_validator(self, headers: Mapping) -> None:
+        """Remember validator of response content is written from."""
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            self.validator = etag
+        else:
+            self.validator = headers.get('Last-Modified')
+        with open(self.validator_path, 'w') as out_file:
+            json.dump(
+                {'validator': self.validator, 'blob_sha': self.blob_sha},
+                out_file,
+            )
+
+    def discard(self) -> None:
+        """Delete partial file and its validator."""
+        self.path.unlink(missing_ok=True)
+        self.validator_path.unlink(missing_ok=True)
+        self.restart()
+
+
+def backoff_delay(attempt: int) -> float:
+    """Return exponential backoff with full jitter for given attempt."""
+    return random.uniform(  # noqa: S311
+        0,
+        min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt),
+    )
+
+
+def is_retryable(status: int) -> bool:
+    """Return True if request failed with given status may succeed later."""
+    retry_statuses = {REQUEST_TIMEOUT, TOO_MANY_REQUESTS}
+    return status in retry_statuses or status >= SERVER_ERROR
+
+
+def record_download(
+    result: DownloadResult,
+    partial: PartialFile,
+    elapsed: float,
+) -> None:
+    """Record duration, size and retries of finished download."""
+    registry.increment('retries', result.attempts - 1)
+    if not result.ok:
+        registry.increment('download_failures')
+        return
+    registry.increment('files_downloaded')
+    registry.observe('download_seconds', elapsed)
+    registry.observe('write_seconds', partial.write_seconds)
+    registry.observe('hash_seconds', partial.hash_seconds)
+    registry.observe('file_bytes', result.size, SIZE_BUCKETS)
+
+
+def can_resume(partial: PartialFile) -> bool:
+    """Return True if partial file may be continued.
+
+    Content must come from the same blob as expected now, and it must be
+    checkable: by validator sent in If-Range, or by git blob sha of
+    whole file when its size is known.
+    """
+    try:
+        with open(partial.validator_path) as in_file:
+            saved = json.load(in_file)
+    except (OSError, ValueError):
+        return False
+    if not isinstance(saved, dict):
+        return False
+    if saved.get('blob_sha') != partial.blob_sha:
+        return False
+    partial.validator = saved.get('validator')
+    blob_checkable = partial.blob_sha is not None and partial.size is not None
+    return partial.validator is not None or blob_checkable
+
+
+async def load_partial(
+    part_path: Path,
+    algorithms: Tuple[str, ...] = (SHA256,),
+    size: Optional[int] = None,
+    blob_sha: Optional[str] = None,
+) -> PartialFile:
+    """Hash partial file left by interrupted download.
+
+    Partial file of unknown origin or of other blob is deleted.
+    """
+    partial = PartialFile(part_path, algorithms, size, blob_sha=blob_sha)
+    if part_path.is_file() and not can_resume(partial):
+        partial.discard()
+    elif part_path.is_file():
+        partial.offset = await asyncio.get_running_loop().run_in_executor(
+            None,
+            update_hash,
+            partial.hasher,
+            str(part_path),
+        )
+    return partial
+
+
+async def fetch_to_partial(
+    file_url: str,
+    session: ClientSession,
+    partial: PartialFile,
+    chunk_size: int = CHUNK_SIZE,
+    limiter: Optional[Limiter] = None,
+) -> None:
+    """Stream remaining part of file to disk, asking server for Range.
+
+    Range is conditional on validator of written content, so changed
+    file is sent whole. Without validator content is resumed only if
+    git blob sha of whole file is computed to check it. If server
+    ignores Range header, download starts from scratch.
+    """
+    if partial.offset and not partial.validator:
+        if GIT_BLOB_SHA1 not in partial.algorithms:
+            partial.restart()
+    headers = {}
+    if partial.offset:
+        headers['Range'] = 'bytes={0}-'.format(partial.offset)
+        headers['Accept-Encoding'] = 'identity'
+        if partial.validator:
+            headers['If-Range'] = partial.validator
+    started = time.monotonic()
+    async with session.get(
+        file_url,
+        headers=headers,
+        raise_for_status=True,
+    ) as response:
+        latency = time.monotonic() - started
+        if partial.offset and response.status != PARTIAL_CONTENT:
+            partial.restart()
+        partial.resumed = partial.resumed or bool(partial.offset)
+        if not partial.offset:
+            partial.save_validator(response.headers)
+        nbytes = 0
+        if partial.path.exists():
+            os.truncate(partial.path, partial.offset)
+        mode = 'r+b' if partial.offset else 'bw'
+        async with async_open(partial.path, mode) as out_file:
+            out_file.seek(partial.offset)
+            async for chunk in response.content.iter_chunked(chunk_size):
+                write_started = time.perf_counter()
+                await out_file.write(chunk)
+                hash_started = time.perf_counter()
+                partial.hasher.update(chunk)
+                partial.write_seconds += hash_started - write_started
+                partial.hash_seconds += time.perf_counter() - hash_started
+                partial.offset += len(chunk)
+                nbytes += len(chunk)
+    registry.increment('bytes_received', nbytes)
+    if limiter is not None:
+        limiter.record_success(latency, nbytes)
+
+
+def check_content(
+    result: DownloadResult,
+    partial: PartialFile,
+    expected_size: Optional[int],
+    expected_blob_sha: Optional[str],
+    verify_blob: bool,
+) -> None:
+    """Store hashes of downloaded content, raise if it is not expected.
+
+    Partial file of other blob is discarded.
+    """
+    if expected_size is not None and partial.offset != expected_size:
+        raise SizeMismatchError('{0} bytes of {1} received'.format(
+            partial.offset,
+            expected_size,
+        ))
+    result.hashes = partial.hasher.hexdigests()
+    blob_sha = result.hashes.get(GIT_BLOB_SHA1)
+    if not verify_blob or not blob_sha or not expected_blob_sha:
+        return
+    if blob_sha != expected_blob_sha:
+        resumed = partial.resumed
+        partial.discard()
+        raise BlobMismatchError(
+            'git blob sha {0} != {1}'.format(blob_sha, expected_blob_sha),
+            resumed,
+        )
+
+
+def retry_delay(
+    err: Exception,
+    result: DownloadResult,
+    partial: PartialFile,
+    limiter: Optional[Limiter] = None,
+) -> Optional[float]:
+    """Record failed attempt, return delay before retry, None to give up.
+
+    Resumed file of other blob is downloaded again at once, file that
+    differs from listed blob when downloaded whole is not retried.
+    """
+    retry_after = None
+    if isinstance(err, ClientResponseError):
+        result.error = 'HTTP {0}'.format(err.status)
+        retry_after = parse_retry_after(err.headers)
+        if limiter is not None:
+            limiter.record_failure(err.status, retry_after)
+        if err.status == RANGE_NOT_SATISFIABLE:
+            partial.restart()
+        elif not is_retryable(err.status):
+            return None
+    elif isinstance(err, (ClientError, asyncio.TimeoutError)):
+        result.error = repr(err)
+        if limiter is not None:
+            limiter.record_failure()
+    elif isinstance(err, BlobMismatchError):
+        result.error = str(err)
+        result.blob_mismatch = not err.resumed
+        return 0 if err.resumed else None
+    elif isinstance(err, SizeMismatchError):
+        result.error = str(err)
+        if partial.size is not None and partial.offset > partial.size:
+            partial.restart()
+    else:
+        result.error = repr(err)
+        return None
+    return max(retry_after or 0, backoff_delay(result.attempts))
+
+
+def finish_download(
+    result: DownloadResult,
+    partial: PartialFile,
+    started: float,
+) -> None:
+    """Fill result of completed download and record its metrics."""
+    result.error = None
+    result.sha256 = result.hashes[SHA256]
+    result.size = partial.offset
+    elapsed = time.perf_counter() - started
+    result.timings = {
+        'download_seconds': round(elapsed, 6),
+        'write_seconds': round(partial.write_seconds, 6),
+        'hash_seconds': round(partial.hash_seconds, 6),
+    }
+    record_download(result, partial, elapsed)
+
+
+async def download_file(
+    file_url: str,
+    session: ClientSession,
+    path_to_file: Path,
+    chunk_size: int = CHUNK_SIZE,
+    limiter: Optional[Limiter] = None,
+    expected_size: Optional[int] = None,
+    max_attempts: int = MAX_ATTEMPTS,
+    hash_options: HashOptions = HashOptions(),
+    expected_blob_sha: Optional[str] = None,
+) -> DownloadResult:
+    """Stream file with given URL to disk, hashing chunks on the way.
+
+    Content goes to '.part' file renamed to target path once complete.
+    Failed attempts are retried with exponential backoff and jitter,
+    continuing with HTTP Range request from already written bytes.
+    Completeness is checked against expected size when it is known.
+    All requested hashes are computed in the same pass. In blob
+    verification mode file whose git blob id differs from expected one
+    is flagged as failed and not kept. Resumed file is always checked
+    against expected blob id when it is known and downloaded again
+    from scratch if it differs.
+    """
+    file_logger.info('Processing: %s', file_url)  # noqa: WPS323
+    started = time.perf_counter()
+    result = DownloadResult(file_url, path_to_file, blob_sha=expected_blob_sha)
+    part_path = path_to_file.with_name(path_to_file.name + PART_SUFFIX)
+    verify_blob = hash_options.verify_blob or (
+        expected_blob_sha is not None and part_path.is_file()
+    )
+    algorithms = HashOptions(hash_options.algorithms, verify_blob).for_size(
+        expected_size,
+    )
+    partial = await load_partial(
+        part_path,
+        algorithms,
+        expected_size,
+        expected_blob_sha,
+    )
+    result.resumed_from = partial.offset
+    while result.attempts < max_attempts:
+        result.attempts += 1
+        try:
+            await fetch_to_partial(
+                file_url,
+                session,
+                partial,
+                chunk_size,
+                limiter,
+            )
+            check_content(
+                result,
+                partial,
+                expected_size,
+                expected_blob_sha,
+                verify_blob,
+            )
+            os.replace(partial.path, path_to_file)
+            partial.validator_path.unlink(missing_ok=True)
+        except (
+            ClientError,
+            asyncio.TimeoutError,
+            ContentMismatchError,
+            OSError,
+        ) as err:
+            delay = retry_delay(err, result, partial, limiter)
+        else:
+            finish_download(result, partial, started)
+            return result
+        if delay is None:
+            break
+        if result.attempts < max_attempts:
+            file_logger.warning(
+                'Retrying %s in %.2fs: %s',  # noqa: WPS323
+                file_url,
+                delay,
+                result.error,
+            )
+            await asyncio.sleep(delay)
+    file_logger.error(
+        'Download failed: %s (%s)',  # noqa: WPS323
+        file_url,
+        result.error,
+    )
+    record_download(result, partial, time.perf_counter() - started)
+    return result
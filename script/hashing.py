@@ -0,0 +1,114 @@
+"""Hash many files choosing inline, thread or process execution."""
+
+import atexit
+import os
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import Iterable, Iterator, Optional
+
+from aux_utils import get_hash
+
+INLINE_MAX_BYTES: int = 1024 * 1024
+GIL_RELEASE_SIZE: int = 2048
+PROCESS_MIN_FILES: int = 1000
+PROCESS_MIN_BYTES: int = 64 * 1024 * 1024
+CHUNKS_PER_WORKER: int = 4
+
+INLINE: str = 'inline'
+THREADS: str = 'threads'
+PROCESSES: str = 'processes'
+
+
+def choose_strategy(sizes: list) -> str:
+    """Return execution strategy for files of given sizes.
+
+    Little total work is hashed inline, pool startup would cost more.
+    hashlib releases GIL for updates of 2 KiB or more, so all but tiny
+    files scale on threads. Processes pay off only for lots of tiny
+    files, where GIL is held during hashing and IPC is amortized by
+    batching.
+    """
+    total_bytes = sum(sizes)
+    if len(sizes) <= 1 or total_bytes <= INLINE_MAX_BYTES:
+        return INLINE
+    average_size = total_bytes / len(sizes)
+    many_small_files = (
+        len(sizes) >= PROCESS_MIN_FILES and average_size < GIL_RELEASE_SIZE
+    )
+    if many_small_files and total_bytes >= PROCESS_MIN_BYTES:
+        return PROCESSES
+    return THREADS
+
+
+class HashingEngine:
+    """Long-lived thread and process pools for file hashing.
+
+    Pools are created on first use and reused by every later call.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        """Create engine, pools are started lazily."""
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        """Return shared thread pool."""
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                self.max_workers,
+                thread_name_prefix='hashing',
+            )
+        return self._thread_pool
+
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        """Return shared process pool."""
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(self.max_workers)
+        return self._process_pool
+
+    def executor(self, strategy: str) -> Optional[Executor]:
+        """Return pool for strategy, None for inline hashing."""
+        if strategy == PROCESSES:
+            return self.process_pool
+        if strategy == THREADS:
+            return self.thread_pool
+        return None
+
+    def hash_files(
+        self,
+        paths: Iterable,
+        strategy: Optional[str] = None,
+    ) -> Iterator[tuple]:
+        """Yield (path, sha256) pairs in order of given paths."""
+        paths = list(paths)
+        if strategy is None:
+            sizes = [os.stat(path).st_size for path in paths]
+            strategy = choose_strategy(sizes)
+        executor = self.executor(strategy)
+        if executor is None:
+            hashes = map(get_hash, paths)
+        else:
+            chunksize = 1
+            if strategy == PROCESSES:
+                batch_num = self.max_workers * CHUNKS_PER_WORKER
+                chunksize = max(len(paths) // batch_num, 1)
+            hashes = executor.map(get_hash, paths, chunksize=chunksize)
+        return zip(paths, hashes)
+
+    def close(self) -> None:
+        """Shut pools down."""
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown()
+        self._thread_pool = None
+        self._process_pool = None
+
+
+engine = HashingEngine()
+atexit.register(engine.close)
@@ -0,0 +1,74 @@
+"""Keep on-disk cache of API responses for conditional requests."""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+from yarl import URL
+
+
+class CacheEntry(NamedTuple):
+    """Cached JSON response with its validators.
+
+    Sha is git object id of listed directory as reported by its parent
+    listing, if known.
+    """
+
+    body: Union[dict, list]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    sha: Optional[str] = None
+
+    def conditional_headers(self) -> dict:
+        """Return headers asking server for body only if it changed."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """Cache of JSON responses stored in one file per request URL."""
+
+    def __init__(self, directory: str) -> None:
+        """Create cache in given directory."""
+        self.directory = Path(directory)
+
+    def entry_path(self, url: str, params: Optional[dict] = None) -> Path:
+        """Return path of cache file of given request."""
+        request_url = URL(url)
+        if params:
+            request_url = request_url.update_query(params)
+        key = hashlib.sha256(str(request_url).encode()).hexdigest()
+        return self.directory / key[:2] / '{0}.json'.format(key[2:])
+
+    def get(
+        self,
+        url: str,
+        params: Optional[dict] = None,
+    ) -> Optional[CacheEntry]:
+        """Return cached response, None if missing or unreadable."""
+        try:
+            with open(self.entry_path(url, params)) as in_file:
+                return CacheEntry(**json.load(in_file))
+        except (OSError, TypeError, ValueError):
+            return None
+
+    def put(
+        self,
+        url: str,
+        cache_entry: CacheEntry,
+        params: Optional[dict] = None,
+    ) -> None:
+        """Store response atomically."""
+        entry_path = self.entry_path(url, params)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=entry_path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w') as out_file:
+            json.dump(cache_entry._asdict(), out_file)
+        os.replace(tmp_name, entry_path)
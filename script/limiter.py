@@ -0,0 +1,260 @@
+"""Limit number of concurrent downloads adapting to server behavior."""
+
+import asyncio
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional, Union
+
+BACKOFF_FACTOR: float = 0.5
+LATENCY_TOLERANCE: float = 2.0
+LATENCY_SLACK: float = 0.05
+LATENCY_SMOOTHING: float = 0.2
+TOO_MANY_REQUESTS: int = 429
+
+
+def parse_retry_after(headers: Optional[Mapping]) -> Optional[float]:
+    """Return delay in seconds advertised by Retry-After header."""
+    if not headers:
+        return None
+    retry_after = headers.get('Retry-After')
+    if not retry_after:
+        return None
+    try:
+        return max(float(retry_after), 0)
+    except ValueError:
+        pass  # noqa: WPS420
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+def is_throttled(status: Optional[int]) -> bool:
+    """Return True if response status means server is overloaded."""
+    return status is None or status == TOO_MANY_REQUESTS or status >= 500
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limiter.
+
+    Limit grows by one slot per limit-sized window of successful requests
+    and is halved on throttling responses, timeouts or when latency
+    (time to response headers) exceeds tolerated multiple of the best
+    seen latency. Decreases are
+    spaced by one smoothed latency, so a burst of failures of requests
+    sent with the old limit counts once. Retry-After pauses new
+    acquisitions. With min_limit equal to max_limit the limit is fixed.
+    """
+
+    def __init__(
+        self,
+        initial: int = 3,
+        min_limit: int = 1,
+        max_limit: int = 64,
+    ) -> None:
+        """Create limiter starting at given limit."""
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.bytes_received = 0
+        self.started_at = time.monotonic()
+        self._waiters: deque = deque()
+        self._resume_at = 0.0
+        self._last_decrease = 0.0
+        self._min_latency: Optional[float] = None
+        self._latency: Optional[float] = None
+
+    @property
+    def adaptive(self) -> bool:
+        """Return True if limit may change."""
+        return self.min_limit != self.max_limit
+
+    async def acquire(self) -> None:
+        """Wait for free slot and Retry-After pause to pass."""
+        while True:
+            delay = self._resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif self.in_flight < int(self.limit):
+                break
+            else:
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                try:
+                    await waiter
+                except asyncio.CancelledError:
+                    self._wake()
+                    raise
+        self.in_flight += 1
+
+    def release(self) -> None:
+        """Free slot taken by acquire."""
+        self.in_flight -= 1
+        self._wake()
+
+    def record_success(self, latency: float, nbytes: int = 0) -> None:
+        """Account finished request and grow limit if latency allows."""
+        self.completed += 1
+        self.bytes_received += nbytes
+        if self._min_latency is None or latency < self._min_latency:
+            self._min_latency = latency
+        if self._latency is None:
+            self._latency = latency
+        self._latency += LATENCY_SMOOTHING * (latency - self._latency)
+        tolerated_latency = max(
+            LATENCY_TOLERANCE * self._min_latency,
+            self._min_latency + LATENCY_SLACK,
+        )
+        if self._latency > tolerated_latency:
+            self._decrease()
+        elif self.adaptive:
+            self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+            self._wake()
+
+    def record_failure(
+        self,
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """Account failed request, back off if server is throttling.
+
+        Status None stands for timeout or connection error.
+        """
+        self.failed += 1
+        if retry_after:
+            self._resume_at = max(
+                self._resume_at,
+                time.monotonic() + retry_after,
+            )
+        if is_throttled(status):
+            self._decrease()
+
+    def snapshot(self) -> dict:
+        """Return current limit and throughput metrics."""
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            'limit': int(self.limit),
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'bytes': self.bytes_received,
+            'files_per_sec': round(self.completed / elapsed, 3),
+            'bytes_per_sec': round(self.bytes_received / elapsed, 3),
+            'latency': round(self._latency or 0, 6),
+        }
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        cooldown = self._latency or 0
+        if not self.adaptive or now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.limit * BACKOFF_FACTOR, self.min_limit)
+
+    def _wake(self) -> None:
+        free_slots = int(self.limit) - self.in_flight
+        while free_slots > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free_slots -= 1
+
+
+class FairBudget:
+    """Concurrency budget shared by several hosts.
+
+    Free slots are handed to waiting hosts round-robin, so one host with
+    many queued files can not starve others.
+    """
+
+    def __init__(self, limit: int) -> None:
+        """Create budget with given number of slots."""
+        self.limit = max(limit, 1)
+        self.in_flight = 0
+        self._waiters: dict = {}
+
+    async def acquire(self, key: str) -> None:
+        """Wait for slot on behalf of given host."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(waiter)
+        self._hand_over()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Free slot taken by acquire."""
+        self.in_flight -= 1
+        self._hand_over()
+
+    def _hand_over(self) -> None:
+        while self.in_flight < self.limit and self._waiters:
+            key = next(iter(self._waiters))
+            waiters = self._waiters.pop(key)
+            waiter = waiters.popleft()
+            if waiters:
+                self._waiters[key] = waiters
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+class BudgetedLimiter:
+    """Host limiter which also takes slot of budget shared by all hosts."""
+
+    def __init__(
+        self,
+        limiter: AdaptiveLimiter,
+        budget: FairBudget,
+        key: str,
+    ) -> None:
+        """Combine limiter of single host with shared budget."""
+        self.limiter = limiter
+        self.budget = budget
+        self.key = key
+
+    @property
+    def max_limit(self) -> int:
+        """Return highest possible limit of host."""
+        return self.limiter.max_limit
+
+    async def acquire(self) -> None:
+        """Wait for host slot, then for budget slot."""
+        await self.limiter.acquire()
+        try:
+            await self.budget.acquire(self.key)
+        except asyncio.CancelledError:
+            self.limiter.release()
+            raise
+
+    def release(self) -> None:
+        """Free both slots."""
+        self.budget.release()
+        self.limiter.release()
+
+    def record_success(self, latency: float, nbytes: int = 0) -> None:
+        """Account finished request of host."""
+        self.limiter.record_success(latency, nbytes)
+
+    def record_failure(
+        self,
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """Account failed request of host."""
+        self.limiter.record_failure(status, retry_after)
+
+    def snapshot(self) -> dict:
+        """Return host limit and throughput metrics."""
+        return self.limiter.snapshot()
+
+
+Limiter = Union[AdaptiveLimiter, BudgetedLimiter]
@@ -1,9 +1,85 @@
 """Return list of links in specifed remote repository directory."""
 
-from typing import Union
+import asyncio
+from dataclasses import dataclass
+from functools import partial
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    NamedTuple,
+    Optional,
+    Union,
+)
+from urllib.parse import quote
 
 from aiohttp import ClientError, ClientSession
+from http_cache import CacheEntry, HttpCache
 from loggers import logger
+from yarl import URL
+
+DIR_CONCURRENCY: int = 8
+FILE_BUFFER_SIZE: int = 1000
+TREE_PAGE_SIZE: int = 1000
+SYMLINK_MODE: str = '120000'
+NOT_MODIFIED: int = 304
+
+
+@dataclass
+class TraversalStats:
+    """Repo traversal statistics."""
+
+    requests: int = 0
+    depth: int = 0
+    errors: int = 0
+    not_modified: int = 0
+    cached: int = 0
+    skipped: int = 0
+
+
+class RepoFile(NamedTuple):
+    """Repo file entry discovered during traversal."""
+
+    path: str
+    download_url: str
+    sha: Optional[str] = None
+    size: Optional[int] = None
+
+
+def make_repo_file(json_data: dict) -> RepoFile:
+    """Build repo file entry from contents API json object."""
+    return RepoFile(
+        path=json_data.get('path') or '',
+        download_url=json_data['download_url'],
+        sha=json_data.get('sha'),
+        size=json_data.get('size'),
+    )
+
+
+class RepoLocation(NamedTuple):
+    """Repo directory addressed by contents API URL."""
+
+    api_url: str
+    path: str
+    ref: Optional[str]
+
+
+def parse_contents_url(url: str) -> RepoLocation:
+    """Split contents API URL into repo API URL, directory path and ref."""
+    parsed = URL(url)
+    parts = parsed.parts
+    try:
+        contents_pos = parts.index('contents')
+    except ValueError:
+        err_msg = 'Not a contents API URL: {0}'.format(url)
+        logger.error(err_msg)
+        raise ValueError(err_msg)
+    api_url = parsed.origin().with_path('/'.join(parts[1:contents_pos]))
+    return RepoLocation(
+        api_url=str(api_url),
+        path='/'.join(parts[contents_pos + 1:]).strip('/'),
+        ref=parsed.query.get('ref'),
+    )
 
 
 async def parse_json_content(json_data: dict, session: ClientSession) -> list:
@@ -26,16 +102,373 @@ async def parse_json_content(json_data: dict, session: ClientSession) -> list:
     return link_list
 
 
-async def parse_repo_dir(url: str, session: ClientSession) -> list:
-    """Recursively parse given repo directory."""
-    link_list: list[str] = []
+async def fetch_json(
+    url: str,
+    session: ClientSession,
+    stats: TraversalStats,
+    params: Optional[dict] = None,
+    cache: Optional[HttpCache] = None,
+    sha: Optional[str] = None,
+) -> Optional[Union[dict, list]]:
+    """Fetch json document, return None on failure.
+
+    With cache, request is conditional on cached ETag and Last-Modified,
+    cached body is reused on 304. Given sha is stored with response.
+    """
+    cached = cache.get(url, params) if cache is not None else None
+    headers = cached.conditional_headers() if cached is not None else {}
+    stats.requests += 1
     try:
-        async with session.get(url) as resp:
-            response_json = await resp.json()
-    except ClientError:
+        async with session.get(
+            url,
+            params=params,
+            headers=headers,
+            raise_for_status=True,
+        ) as resp:
+            if resp.status == NOT_MODIFIED and cached is not None:
+                stats.not_modified += 1
+                if sha is not None and sha != cached.sha:
+                    cache.put(url, cached._replace(sha=sha), params)
+                return cached.body
+            body = await resp.json()
+            if cache is not None:
+                cache.put(url, CacheEntry(
+                    body,
+                    resp.headers.get('ETag'),
+                    resp.headers.get('Last-Modified'),
+                    sha,
+                ), params)
+            return body
+    except (ClientError, asyncio.TimeoutError):
+        stats.errors += 1
         logger.error('Error occured.')
+    return None
+
+
+async def fetch_dir_listing(
+    url: str,
+    session: ClientSession,
+    stats: TraversalStats,
+    cache: Optional[HttpCache] = None,
+    sha: Optional[str] = None,
+) -> list:
+    """Fetch json listing of single repo directory.
+
+    Cached listing of directory whose sha did not change is reused
+    without request, since its content is the same.
+    """
+    cached = cache.get(url) if cache is not None and sha else None
+    if cached is not None and cached.sha == sha:
+        stats.cached += 1
+        listing = cached.body
     else:
-        for json_obj in response_json:
-            extracted_links = await parse_json_content(json_obj, session)
-            link_list.extend(extracted_links)
+        listing = await fetch_json(url, session, stats, cache=cache, sha=sha)
+    return listing if isinstance(listing, list) else []
+
+
+def skip_entry(json_obj: dict, stats: TraversalStats) -> None:
+    """Count and log entry that is neither file nor directory."""
+    stats.skipped += 1
+    msg = 'Skipped {0} entry: {1}'.format(
+        json_obj.get('type'),
+        json_obj.get('path'),
+    )
+    logger.warning(msg)
+
+
+async def _queue_entries(
+    listing: list,
+    depth: int,
+    dir_queue: asyncio.Queue,
+    file_queue: asyncio.Queue,
+    stats: TraversalStats,
+) -> None:
+    for json_obj in listing:
+        obj_type: Union[str, None] = json_obj.get('type')
+        if obj_type == 'file':
+            if json_obj.get('download_url'):
+                await file_queue.put(make_repo_file(json_obj))
+        elif obj_type == 'dir':
+            subdir_url = json_obj.get('url')
+            if subdir_url:
+                dir_queue.put_nowait(
+                    (subdir_url, depth + 1, json_obj.get('sha')),
+                )
+        else:
+            skip_entry(json_obj, stats)
+
+
+async def _dir_worker(
+    dir_queue: asyncio.Queue,
+    file_queue: asyncio.Queue,
+    session: ClientSession,
+    stats: TraversalStats,
+    cache: Optional[HttpCache],
+) -> None:
+    while True:
+        dir_url, depth, dir_sha = await dir_queue.get()
+        try:
+            stats.depth = max(stats.depth, depth)
+            listing = await fetch_dir_listing(
+                dir_url,
+                session,
+                stats,
+                cache,
+                dir_sha,
+            )
+            await _queue_entries(listing, depth, dir_queue, file_queue, stats)
+        finally:
+            dir_queue.task_done()
+
+
+async def _supervise(dir_queue: asyncio.Queue, workers: list) -> None:
+    joined = asyncio.ensure_future(dir_queue.join())
+    try:
+        await asyncio.wait(
+            [joined, *workers],
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        for task in workers:
+            if task.done():
+                task.result()
+    finally:
+        joined.cancel()
+        await asyncio.gather(joined, return_exceptions=True)
+
+
+async def walk_repo(
+    url: str,
+    session: ClientSession,
+    concur_dir_num: int = DIR_CONCURRENCY,
+    stats: Optional[TraversalStats] = None,
+    buffer_size: int = FILE_BUFFER_SIZE,
+    cache: Optional[HttpCache] = None,
+) -> AsyncIterator[RepoFile]:
+    """Yield repo files while sibling directories are fetched concurrently.
+
+    Directories are walked breadth-first from a work queue. Discovered
+    files are buffered in a bounded queue, so traversal pauses when the
+    consumer falls behind. With cache, subtrees whose sha did not change
+    are walked from cached listings without requests. Symlinks and
+    submodules are skipped.
+    """
+    if stats is None:
+        stats = TraversalStats()
+    dir_queue: asyncio.Queue = asyncio.Queue()
+    file_queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+    dir_queue.put_nowait((url, 1, None))
+    workers = [
+        asyncio.create_task(
+            _dir_worker(dir_queue, file_queue, session, stats, cache),
+        )
+        for _ in range(max(concur_dir_num, 1))
+    ]
+    supervisor = asyncio.create_task(_supervise(dir_queue, workers))
+    try:
+        while True:
+            if not file_queue.empty():
+                yield file_queue.get_nowait()
+                continue
+            if supervisor.done():
+                break
+            getter = asyncio.ensure_future(file_queue.get())
+            await asyncio.wait(
+                [getter, supervisor],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+        supervisor.result()
+    finally:
+        supervisor.cancel()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(supervisor, *workers, return_exceptions=True)
+
+
+async def resolve_ref(
+    location: RepoLocation,
+    session: ClientSession,
+    stats: TraversalStats,
+    cache: Optional[HttpCache] = None,
+) -> Optional[str]:
+    """Return ref of repo location, asking for default branch if needed."""
+    if location.ref is not None:
+        return location.ref
+    repo_json = await fetch_json(
+        location.api_url,
+        session,
+        stats,
+        cache=cache,
+    )
+    if not isinstance(repo_json, dict):
+        return None
+    return repo_json.get('default_branch') or 'master'
+
+
+def _tree_files(
+    tree_json: dict,
+    location: RepoLocation,
+    ref: str,
+    stats: TraversalStats,
+) -> list:
+    prefix = '{0}/'.format(location.path) if location.path else ''
+    repo_files = []
+    for json_obj in tree_json.get('tree') or []:
+        path: str = json_obj.get('path', '')
+        if not path.startswith(prefix) or json_obj.get('type') == 'tree':
+            continue
+        if json_obj.get('type') != 'blob':
+            skip_entry(json_obj, stats)
+            continue
+        if json_obj.get('mode') == SYMLINK_MODE:
+            skip_entry({**json_obj, 'type': 'symlink'}, stats)
+            continue
+        stats.depth = max(stats.depth, path[len(prefix):].count('/') + 1)
+        download_url = '{0}/raw/{1}?ref={2}'.format(
+            location.api_url,
+            quote(path),
+            quote(ref, safe=''),
+        )
+        repo_files.append(RepoFile(
+            path=path,
+            download_url=download_url,
+            sha=json_obj.get('sha'),
+            size=json_obj.get('size'),
+        ))
+    return repo_files
+
+
+async def _fetch_tree_page(
+    tree_url: str,
+    session: ClientSession,
+    stats: TraversalStats,
+    cache: Optional[HttpCache],
+    page: int,
+) -> Optional[Union[dict, list]]:
+    return await fetch_json(
+        tree_url,
+        session,
+        stats,
+        {'recursive': 'true', 'page': page, 'per_page': TREE_PAGE_SIZE},
+        cache,
+    )
+
+
+def _page_count(first_page: dict) -> int:
+    page_len = len(first_page.get('tree') or [])
+    total_count = first_page.get('total_count') or 0
+    return -(-total_count // page_len) if page_len else 0
+
+
+async def _fetch_pages(
+    fetch_page: Callable[[int], Awaitable],
+    first_page: dict,
+    page_count: int,
+    concur_page_num: int,
+) -> AsyncIterator[dict]:
+    yield first_page
+    step = max(concur_page_num, 1)
+    for first in range(2, page_count + 1, step):
+        pages = await asyncio.gather(*[
+            fetch_page(page)
+            for page in range(first, min(first + step, page_count + 1))
+        ])
+        for tree_json in pages:
+            if isinstance(tree_json, dict):
+                yield tree_json
+
+
+async def walk_repo_tree(  # noqa: WPS210
+    url: str,
+    session: ClientSession,
+    concur_dir_num: int = DIR_CONCURRENCY,
+    stats: Optional[TraversalStats] = None,
+    buffer_size: int = FILE_BUFFER_SIZE,
+    cache: Optional[HttpCache] = None,
+) -> AsyncIterator[RepoFile]:
+    """Yield repo files listed by recursive git trees API.
+
+    Whole tree comes in a few paged requests instead of one request per
+    directory. Pages past the first one are fetched concurrently, failed
+    pages are counted as errors. If the server truncates the tree without
+    paging support, remaining files are discovered with contents API walk.
+    """
+    if stats is None:
+        stats = TraversalStats()
+    location = parse_contents_url(url)
+    ref = await resolve_ref(location, session, stats, cache)
+    if ref is None:
+        return
+    tree_url = '{0}/git/trees/{1}'.format(
+        location.api_url,
+        quote(ref, safe=''),
+    )
+    fetch_page = partial(_fetch_tree_page, tree_url, session, stats, cache)
+    first_page = await fetch_page(1)
+    if not isinstance(first_page, dict):
+        return
+    page_count = _page_count(first_page)
+    fallback = bool(first_page.get('truncated')) and page_count <= 1
+    seen_paths: set = set()
+    async for tree_json in _fetch_pages(
+        fetch_page,
+        first_page,
+        page_count,
+        concur_dir_num,
+    ):
+        for repo_file in _tree_files(tree_json, location, ref, stats):
+            if fallback:
+                seen_paths.add(repo_file.path)
+            yield repo_file
+    if not fallback:
+        return
+
+    logger.warning('Tree listing is truncated, falling back to contents.')
+    async for contents_file in walk_repo(
+        url,
+        session,
+        concur_dir_num,
+        stats,
+        buffer_size,
+        cache,
+    ):
+        if contents_file.path not in seen_paths:
+            yield contents_file
+
+
+DISCOVERY_BACKENDS: dict = {
+    'contents': walk_repo,
+    'trees': walk_repo_tree,
+}
+
+
+async def traverse_repo(
+    url: str,
+    session: ClientSession,
+    concur_dir_num: int = DIR_CONCURRENCY,
+    discovery: str = 'contents',
+    cache: Optional[HttpCache] = None,
+) -> tuple[list, TraversalStats]:
+    """Collect links of all repo files with given discovery backend."""
+    stats = TraversalStats()
+    walk = DISCOVERY_BACKENDS[discovery]
+    link_list = [
+        repo_file.download_url
+        async for repo_file in walk(
+            url,
+            session,
+            concur_dir_num,
+            stats,
+            cache=cache,
+        )
+    ]
+    return link_list, stats
+
+
+async def parse_repo_dir(url: str, session: ClientSession) -> list:
+    """Parse given repo directory and all its subdirectories."""
+    link_list, _ = await traverse_repo(url, session)
     return link_list
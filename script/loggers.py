@@ -1,17 +1,115 @@
-"""Set logger for entire application."""
+"""Set logger for entire application.
 
+Records are put to in-process queue and formatted and written by
+listener thread, so slow stream does not block event loop. Nothing is
+installed until configure_logging is called. Per-file
+messages go to separate logger with its own level, file hashes go to
+separate sink as JSON lines.
+"""
+
+import atexit
+import json
 import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
+
+FILE_LOGGER_NAME: str = 'radium.files'
+HASH_LOGGER_NAME: str = 'radium.hashes'
+LOG_LEVELS: tuple = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-logging_handler = logging.StreamHandler()
-logging_handler.setLevel(logging.INFO)
+file_logger = logging.getLogger(FILE_LOGGER_NAME)
+hash_logger = logging.getLogger(HASH_LOGGER_NAME)
+hash_logger.setLevel(logging.INFO)
+hash_logger.propagate = False
 
 formatter = logging.Formatter(
     '[%(levelname)s]:%(asctime)s - %(filename)s - %(funcName)s - %(message)s',
     datefmt='%m/%d/%Y %I:%M:%S %p',
 )
+
+
+class LazyQueueHandler(QueueHandler):
+    """Queue handler leaving message formatting to listener thread.
+
+    Queue is in-process, so record can be passed as is instead of being
+    formatted and stripped of arguments in logging thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Return record unchanged."""
+        return record
+
+
+class HashFormatter(logging.Formatter):
+    """Format hash records as JSON lines."""
+
+    def format(self, record: logging.LogRecord) -> str:  # noqa: A003
+        """Return JSON object with path, hashes and cache flag."""
+        return json.dumps({
+            'path': str(record.path),  # type: ignore[attr-defined]
+            **record.hashes,  # type: ignore[attr-defined]
+            'cached': record.cached,  # type: ignore[attr-defined]
+        })
+
+
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+queue_handler = LazyQueueHandler(log_queue)
+logging_handler = logging.StreamHandler()
 logging_handler.setFormatter(formatter)
+logging_handler.addFilter(lambda record: record.name != HASH_LOGGER_NAME)
+hash_handler = logging.StreamHandler()
+hash_handler.setFormatter(HashFormatter())
+hash_handler.addFilter(lambda record: record.name == HASH_LOGGER_NAME)
+listener = QueueListener(
+    log_queue,
+    logging_handler,
+    hash_handler,
+    respect_handler_level=True,
+)
+
+
+def configure_logging(
+    level: int = logging.INFO,
+    file_level: Optional[int] = None,
+    hash_stream: Optional[TextIO] = None,
+) -> None:
+    """Set log levels and hash sink stream, start listener thread.
+
+    Per-file messages follow main level unless file_level is given.
+    Hashes are not written without hash_stream. Log goes to current
+    stderr.
+    """
+    logger.setLevel(level)
+    file_logger.setLevel(logging.NOTSET if file_level is None else file_level)
+    hash_logger.disabled = hash_stream is None
+    flush_logging()
+    logging_handler.setStream(sys.stderr)
+    if hash_stream is not None:
+        hash_handler.setStream(hash_stream)
+    if queue_handler not in logger.handlers:
+        logger.addHandler(queue_handler)
+        hash_logger.addHandler(queue_handler)
+        listener.start()
+        atexit.register(listener.stop)
+
+
+def flush_logging() -> None:
+    """Wait until queued records are written."""
+    if queue_handler in logger.handlers:
+        listener.stop()
+        listener.start()
+
 
-logger.addHandler(logging_handler)
+def log_hash(path: object, hashes: dict, cached: bool = False) -> None:
+    """Send file hashes to hash sink."""
+    hash_logger.info(
+        '%s  %s',  # noqa: WPS323
+        hashes.get('sha256'),
+        path,
+        extra={'path': path, 'hashes': hashes, 'cached': cached},
+    )
@@ -1,98 +1,716 @@
 """Download files from repo, save them, calculate hash."""
 
+import argparse
 import asyncio
+import json
+import logging
+import sys
 import tempfile
-from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+    Union,
+)
 
-from aiofile import async_open
-from aiohttp import ClientError, ClientSession
-from aux_utils import get_hash
-from link_extractor import parse_repo_dir
-from loggers import logger
+from aiohttp import ClientSession
+from archive import fetch_archive
+from aux_utils import ALGORITHMS, GIT_BLOB_SHA1, SHA256
+from blob_store import LINK_MODES, BlobStore
+from client_config import ClientConfig, load_client_config
+from downloader import DownloadResult, HashOptions, download_file
+from http_cache import HttpCache
+from limiter import AdaptiveLimiter, Limiter
+from link_extractor import DISCOVERY_BACKENDS, RepoFile, TraversalStats
+from loggers import (
+    LOG_LEVELS,
+    configure_logging,
+    flush_logging,
+    log_hash,
+    logger,
+)
+from manifest import ManifestWriter
+from metrics import (
+    STATSD_PORT,
+    Exporter,
+    JsonExporter,
+    PrometheusExporter,
+    StatsdExporter,
+    registry,
+)
+from scheduler import RunSummary, run_pool
+from sync_index import SyncIndex, mirror_path
 
+DEFAULT_URL: str = ''.join((
+    'https://gitea.radium.group',
+    '/api/v1/repos/radium/project-configuration/contents/',
+))
+MAX_PORT: int = 65535
 
-async def download_file(file_url: str, session: ClientSession) -> bytes:
-    """Download file with given URL."""
-    msg = 'Processing: {0}'.format(file_url)
-    logger.info(msg)
-    file_content = b''
+
+async def process_file(
+    repo_file: RepoFile,
+    session: ClientSession,
+    directory: str,
+    limiter: Limiter,
+    index: Optional[SyncIndex] = None,
+    hash_options: HashOptions = HashOptions(),
+    store: Optional[BlobStore] = None,
+) -> DownloadResult:
+    """Download file from given URL to specified directory and log hash.
+
+    Limiter slot must be acquired by caller, it is released here.
+    Repo directory layout is kept, sync index and blob store are updated.
+    With blob store git blob sha is always computed to check its ref.
+    """
+    url = repo_file.download_url
+    if store is not None:
+        hash_options = hash_options.with_blob_sha()
+    try:
+        path_to_file = mirror_path(directory, repo_file.path)
+        path_to_file.parent.mkdir(parents=True, exist_ok=True)
+    except (OSError, ValueError) as err:
+        limiter.release()
+        return DownloadResult(url, Path(directory), error=repr(err))
     try:
-        async with session.get(file_url) as response:
-            file_content = await response.read()
-    except ClientError as err:
-        logger.error('Error occured.')
-    return file_content
+        download_result = await download_file(
+            url,
+            session,
+            path_to_file,
+            limiter=limiter,
+            expected_size=repo_file.size,
+            hash_options=hash_options,
+            expected_blob_sha=repo_file.sha,
+        )
+    finally:
+        limiter.release()
+    if download_result.ok:
+        log_hash(path_to_file, download_result.hashes)
+        if store is not None:
+            await store_file(store, path_to_file, download_result, repo_file)
+        if index is not None:
+            index.update(repo_file, download_result.sha256)
+    return download_result
 
 
-async def write_file_to_tempdir(
-    file_url: str,
-    file_content: bytes,
-    directory: str,
+async def store_file(
+    store: BlobStore,
+    path_to_file: Path,
+    download_result: DownloadResult,
+    repo_file: RepoFile,
 ) -> None:
-    """Write file to given directory."""
-    path_to_file = Path(directory) / Path(file_url).name
+    """Add downloaded file to blob store, failure keeps file as is.
+
+    Listed blob sha is mapped to file only if downloaded content has it.
+    """
+    blob_sha = download_result.hashes.get(GIT_BLOB_SHA1)
+    if blob_sha and repo_file.sha and blob_sha != repo_file.sha:
+        msg = 'Blob ref not stored, {0} has git blob sha {1}, not {2}.'.format(
+            path_to_file,
+            blob_sha,
+            repo_file.sha,
+        )
+        logger.warning(msg)
     try:
-        async with async_open(path_to_file, 'bw') as out_file:
-            await out_file.write(file_content)
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            store.add,
+            path_to_file,
+            download_result.sha256,
+            blob_sha if blob_sha == repo_file.sha else None,
+        )
     except OSError as err:
-        logger.error('Error occured.')
+        msg = 'Blob store update failed: {0!r}'.format(err)
+        logger.warning(msg)
 
 
-async def process_file(
-    url: str,
+async def link_from_store(
+    repo_file: RepoFile,
+    directory: str,
+    store: BlobStore,
+    index: Optional[SyncIndex] = None,
+) -> Optional[DownloadResult]:
+    """Materialize file from blob store, return None if blob is missing.
+
+    Stored blob is neither downloaded nor hashed again.
+    """
+    sha256 = store.lookup(repo_file.sha) if repo_file.sha else None
+    if sha256 is None:
+        return None
+    url = repo_file.download_url
+    try:
+        path_to_file = mirror_path(directory, repo_file.path)
+        size = await asyncio.get_running_loop().run_in_executor(
+            None,
+            store.materialize,
+            sha256,
+            path_to_file,
+        )
+    except (OSError, ValueError) as err:
+        return DownloadResult(url, Path(directory), error=repr(err))
+    log_hash(path_to_file, {SHA256: sha256}, cached=True)
+    registry.increment('files_linked')
+    if index is not None:
+        index.update(repo_file, sha256)
+    return DownloadResult(
+        url,
+        path_to_file,
+        sha256=sha256,
+        size=size,
+        hashes={SHA256: sha256},
+        from_store=True,
+        blob_sha=repo_file.sha,
+    )
+
+
+def report_result(
+    summary: RunSummary,
+    on_result: Optional[Callable[[DownloadResult], None]],
+    download_result: DownloadResult,
+) -> None:
+    """Account result in run summary and pass it to on_result callback."""
+    summary.add(download_result)
+    if on_result is not None:
+        on_result(download_result)
+
+
+async def skip_indexed(
+    repo_files: AsyncIterable[RepoFile],
+    directory: str,
+    index: Optional[SyncIndex],
+    report: Callable[[DownloadResult], None],
+) -> AsyncIterator[RepoFile]:
+    """Yield files to download, report ones up to date in sync index.
+
+    Cached hash of file found in index is logged instead of downloading.
+    """
+    async for repo_file in repo_files:
+        cached = index.lookup(repo_file) if index is not None else None
+        if cached is None:
+            yield repo_file
+            continue
+        path_to_file = mirror_path(directory, repo_file.path)
+        log_hash(path_to_file, {SHA256: cached.sha256}, cached=True)
+        report(DownloadResult(
+            repo_file.download_url,
+            path_to_file,
+            sha256=cached.sha256,
+            size=cached.size or 0,
+            hashes={SHA256: cached.sha256},
+            cached=True,
+            blob_sha=cached.sha,
+        ))
+
+
+async def fetch_file(
+    repo_file: RepoFile,
     session: ClientSession,
     directory: str,
-    semaphore: asyncio.Semaphore,
+    limiter: Limiter,
+    index: Optional[SyncIndex] = None,
+    hash_options: HashOptions = HashOptions(),
+    store: Optional[BlobStore] = None,
+) -> DownloadResult:
+    """Link file from blob store or download it once limiter allows.
+
+    Downloads of blob listed several times wait for the first one.
+    """
+    blob_sha = repo_file.sha if store is not None else None
+    if blob_sha:
+        await store.wait(blob_sha)
+        download_result = await link_from_store(
+            repo_file,
+            directory,
+            store,
+            index,
+        )
+        if download_result is not None:
+            return download_result
+        store.reserve(blob_sha)
+    try:
+        with registry.timer('limiter_wait_seconds'):
+            await limiter.acquire()
+        return await process_file(
+            repo_file,
+            session,
+            directory,
+            limiter,
+            index,
+            hash_options,
+            store,
+        )
+    finally:
+        if blob_sha:
+            store.release(blob_sha)
+
+
+async def handle_file(
+    repo_file: RepoFile,
+    report: Callable[[DownloadResult], None],
+    **fetch_options: object,
 ) -> None:
-    """Download file from given URL and write them to specified directory."""
-    async with semaphore:
-        file_content = await download_file(url, session)
-        await write_file_to_tempdir(url, file_content, directory)
+    """Fetch single file with given options, report its result."""
+    report(await fetch_file(repo_file, **fetch_options))
 
 
 async def run_tasks(
-    urls: list,
+    repo_files: AsyncIterable[RepoFile],
     directory: str,
     session: ClientSession,
-    concur_task_num: int,
-) -> None:
-    """Create and schedule tasks for execution."""
-    sem = asyncio.Semaphore(concur_task_num)
-    tasks = [process_file(url, session, directory, sem) for url in urls]
-    msg = '{0} urls collected.'.format(len(tasks))
+    limiter: Union[Limiter, int],
+    index: Optional[SyncIndex] = None,
+    on_result: Optional[Callable[[DownloadResult], None]] = None,
+    hash_options: HashOptions = HashOptions(),
+    store: Optional[BlobStore] = None,
+) -> RunSummary:
+    """Download files as they are discovered with fixed worker pool.
+
+    One worker per possible limiter slot pulls files from bounded queue,
+    so memory and scheduling overhead depend on concurrency, not on
+    number of files. Integer limiter means fixed number of concurrent
+    downloads. Files whose blob sha matches sync index are not
+    downloaded, cached hash is logged instead. Blobs found in blob store
+    are linked without taking limiter slot, same blob is downloaded once
+    even if listed several times. Every download result is passed to
+    on_result callback as soon as it is known, files found in sync
+    index too as cached results.
+    """
+    if isinstance(limiter, int):
+        limiter = AdaptiveLimiter(limiter, limiter, limiter)
+    summary = RunSummary()
+    report = partial(report_result, summary, on_result)
+    handle = partial(
+        handle_file,
+        report=report,
+        session=session,
+        directory=directory,
+        limiter=limiter,
+        index=index,
+        hash_options=hash_options,
+        store=store,
+    )
+    download_count = await run_pool(
+        skip_indexed(repo_files, directory, index, report),
+        handle,
+        limiter.max_limit,
+    )
+    summary.finish()
+    msg = '{0} urls collected, {1} up to date in index.'.format(
+        download_count + summary.cached,
+        summary.cached,
+    )
+    logger.info(msg)
+    msg = 'Downloads: {0}'.format(limiter.snapshot())
     logger.info(msg)
-    await asyncio.gather(*tasks)
-    await session.close()
+    msg = 'Files: {0}'.format(summary.as_dict())
+    logger.info(msg)
+    return summary
 
 
-def log_file_hashes(paths: list) -> None:
-    """Get file hashes with ProcessPoolExecutor."""
-    with ProcessPoolExecutor() as executor:
-        zipped_paths = zip(paths, executor.map(get_hash, paths))
-        for path, calculated_hash in zipped_paths:
-            msg = '{0} {1}'.format(calculated_hash, path)
-            logger.info(msg)
+async def sync_repo(
+    url: str,
+    directory: str,
+    session: ClientSession,
+    config: ClientConfig,
+    index: Optional[SyncIndex] = None,
+    discovery: str = 'contents',
+    hash_options: HashOptions = HashOptions(),
+    store: Optional[BlobStore] = None,
+    limiter: Optional[Limiter] = None,
+    http_cache: Optional[HttpCache] = None,
+    on_result: Optional[Callable[[DownloadResult], None]] = None,
+) -> Tuple[TraversalStats, RunSummary]:
+    """Discover repo files and download them to given directory.
 
+    Limiter made from config is used unless one is given, every result
+    is passed to on_result callback. Return traversal statistics and
+    download summary.
+    """
+    stats = TraversalStats()
+    walk = DISCOVERY_BACKENDS[discovery]
+    repo_files = walk(
+        url,
+        session,
+        config.dir_concurrency,
+        stats,
+        cache=http_cache,
+    )
 
-async def main(url: str, concur_task_num: int = 3) -> None:
-    """Download file, save them and calculate hash."""
-    logger.info('Script started.')
+    summary = await run_tasks(
+        repo_files,
+        directory,
+        session,
+        limiter or config.make_limiter(),
+        index,
+        on_result,
+        hash_options,
+        store,
+    )
+    msg = ' '.join((
+        'Traversal: {0} requests ({1} not modified),',
+        '{2} listings from cache, depth {3}.',
+    )).format(
+        stats.requests,
+        stats.not_modified,
+        stats.cached,
+        stats.depth,
+    )
+    logger.info(msg)
+    return stats, summary
 
-    with tempfile.TemporaryDirectory() as tempdir:
-        async with ClientSession() as session:
-            urls = await parse_repo_dir(url, session)
 
-            await run_tasks(urls, tempdir, session, concur_task_num)
+async def main(
+    url: str,
+    config: Optional[ClientConfig] = None,
+    mirror_dir: Optional[str] = None,
+    discovery: str = 'contents',
+    mode: str = 'files',
+    hash_options: HashOptions = HashOptions(),
+    exporters: Sequence[Exporter] = (),
+    store: Optional[BlobStore] = None,
+    http_cache: Optional[HttpCache] = None,
+    manifest: Optional[ManifestWriter] = None,
+) -> None:
+    """Download file, save them and calculate hash.
 
-            paths = list(Path(tempdir).iterdir())
-            log_file_hashes(paths)
+    Without mirror directory files go to temporary directory removed
+    afterwards. With it, only files changed since previous run are
+    downloaded and the directory is kept in sync with remote repo.
+    With blob store, blobs stored by previous runs are linked instead
+    of downloaded, new ones are added to it. With HTTP cache, listings
+    are requested conditionally and unchanged subtrees are not listed.
+    Archive mode fetches single repo archive instead of separate files.
+    Every finished file is written to manifest at once, in other modes.
+    Metrics report is logged at the end and passed to exporters.
+    """
+    logger.info('Script started.')
+    if config is None:
+        config = ClientConfig()
+    registry.reset()
 
+    def results_to(directory: str) -> Optional[Callable]:  # noqa: WPS430
+        if manifest is None:
+            return None
+        return partial(manifest.add, directory=directory)
+
+    async with config.make_session() as session:
+        if mode == 'archive':
+            with tempfile.TemporaryDirectory() as tempdir:
+                await fetch_archive(url, tempdir, session)
+        elif mirror_dir is None:
+            with tempfile.TemporaryDirectory() as tempdir:
+                await sync_repo(
+                    url,
+                    tempdir,
+                    session,
+                    config,
+                    discovery=discovery,
+                    hash_options=hash_options,
+                    store=store,
+                    http_cache=http_cache,
+                    on_result=results_to(tempdir),
+                )
+        else:
+            index = SyncIndex.load(mirror_dir)
+            try:
+                stats, _ = await sync_repo(
+                    url,
+                    mirror_dir,
+                    session,
+                    config,
+                    index,
+                    discovery,
+                    hash_options,
+                    store,
+                    http_cache=http_cache,
+                    on_result=results_to(mirror_dir),
+                )
+                index.prune(delete_files=not stats.errors)
+            finally:
+                index.save()
+
+    msg = 'Metrics: {0}'.format(json.dumps(registry.report()))
+    logger.info(msg)
+    for exporter in exporters:
+        exporter.export(registry)
     logger.info('Script completed.')
 
 
+def add_client_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add HTTP client options read by client_config_from_args."""
+    client = parser.add_argument_group(
+        'HTTP client',
+        'options override values from --config file',
+    )
+    client.add_argument(
+        '--config',
+        metavar='FILE',
+        help='JSON file with HTTP client settings',
+    )
+    client.add_argument(
+        '-c',
+        '--concurrency',
+        type=int,
+        help='number of concurrent downloads',
+    )
+    client.add_argument(
+        '--adaptive',
+        action='store_const',
+        const=True,
+        help='adapt number of concurrent downloads to server responses',
+    )
+    client.add_argument(
+        '--max-concurrency',
+        type=int,
+        help='upper bound of adaptive concurrency',
+    )
+    client.add_argument(
+        '--dir-concurrency',
+        type=int,
+        help='number of directories listed concurrently',
+    )
+    client.add_argument(
+        '--pool-limit',
+        type=int,
+        help='total connection pool size, defaults to sum of concurrencies',
+    )
+    client.add_argument(
+        '--pool-limit-per-host',
+        type=int,
+        help='connection pool size for single host',
+    )
+    client.add_argument(
+        '--keepalive-timeout',
+        type=float,
+        help='seconds to keep idle connection open',
+    )
+    client.add_argument(
+        '--dns-cache-ttl',
+        type=int,
+        help='seconds to cache resolved host names',
+    )
+    client.add_argument(
+        '--connect-timeout',
+        type=float,
+        help='socket connect timeout in seconds',
+    )
+    client.add_argument(
+        '--read-timeout',
+        type=float,
+        help='socket read timeout in seconds',
+    )
+    client.add_argument(
+        '--total-timeout',
+        type=float,
+        help='total timeout of single request in seconds',
+    )
+    client.add_argument(
+        '--no-compression',
+        action='store_const',
+        const=False,
+        dest='compression',
+        help='do not ask server for compressed responses',
+    )
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'url',
+        nargs='?',
+        default=DEFAULT_URL,
+        help='contents API URL of repo directory',
+    )
+    parser.add_argument(
+        '--mirror',
+        metavar='DIR',
+        help='keep persistent mirror in DIR, download changed files only',
+    )
+    parser.add_argument(
+        '--discovery',
+        choices=sorted(DISCOVERY_BACKENDS),
+        default='contents',
+        help='list files per directory or with recursive git trees API',
+    )
+    parser.add_argument(
+        '--mode',
+        choices=('files', 'archive'),
+        default='files',
+        help='download files one by one or extract single repo archive',
+    )
+    parser.add_argument(
+        '--store',
+        metavar='DIR',
+        help='keep every unique blob once in DIR, link files from it',
+    )
+    parser.add_argument(
+        '--http-cache',
+        metavar='DIR',
+        help='cache API listings in DIR and request them conditionally',
+    )
+    parser.add_argument(
+        '--link-mode',
+        choices=LINK_MODES,
+        default=LINK_MODES[0],
+        help='how files are made from stored blobs, copy is fallback',
+    )
+    parser.add_argument(
+        '--hash',
+        action='append',
+        choices=ALGORITHMS,
+        default=[],
+        dest='algorithms',
+        help='extra hash to compute while downloading, may be repeated',
+    )
+    parser.add_argument(
+        '--verify-blob',
+        action='store_true',
+        help='check downloaded files against git blob sha from server',
+    )
+    output = parser.add_argument_group('output')
+    output.add_argument(
+        '--log-level',
+        choices=LOG_LEVELS,
+        default='INFO',
+        help='level of log messages',
+    )
+    output.add_argument(
+        '--file-log-level',
+        choices=LOG_LEVELS,
+        help='level of per-file messages, defaults to --log-level',
+    )
+    output.add_argument(
+        '--hash-output',
+        metavar='FILE',
+        default='-',
+        help='write file hashes as JSON lines to FILE, - is stdout',
+    )
+    output.add_argument(
+        '--checksum-file',
+        metavar='FILE',
+        help='write sha256sum-style line of every file to FILE as it ends',
+    )
+    output.add_argument(
+        '--manifest',
+        metavar='FILE',
+        help='write JSON Lines manifest of every file to FILE as it ends',
+    )
+    metrics = parser.add_argument_group('metrics')
+    metrics.add_argument(
+        '--metrics-file',
+        metavar='FILE',
+        help='write JSON metrics report to FILE',
+    )
+    metrics.add_argument(
+        '--prometheus-file',
+        metavar='FILE',
+        help='write metrics to FILE in Prometheus text format',
+    )
+    metrics.add_argument(
+        '--statsd',
+        metavar='HOST[:PORT]',
+        type=statsd_address,
+        help='send metrics to StatsD server, port {0} by default'.format(
+            STATSD_PORT,
+        ),
+    )
+    add_client_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.mode == 'archive' and args.mirror:
+        parser.error('--mirror is not supported in archive mode')
+    if args.mode == 'archive' and args.store:
+        parser.error('--store is not supported in archive mode')
+    if args.mode == 'archive' and (args.checksum_file or args.manifest):
+        parser.error('manifests are not supported in archive mode')
+    return args
+
+
+def client_config_from_args(args: argparse.Namespace) -> ClientConfig:
+    """Return client config from file, overridden by command line."""
+    config = ClientConfig()
+    if args.config:
+        config = load_client_config(args.config)
+    return config.replace(
+        concurrency=args.concurrency,
+        adaptive=args.adaptive,
+        max_concurrency=args.max_concurrency,
+        dir_concurrency=args.dir_concurrency,
+        limit=args.pool_limit,
+        limit_per_host=args.pool_limit_per_host,
+        keepalive_timeout=args.keepalive_timeout,
+        ttl_dns_cache=args.dns_cache_ttl,
+        connect_timeout=args.connect_timeout,
+        sock_read_timeout=args.read_timeout,
+        total_timeout=args.total_timeout,
+        compression=args.compression,
+    )
+
+
+def statsd_address(address: str) -> Tuple[str, int]:
+    """Parse StatsD address option, port is optional."""
+    host, separator, port = address.rpartition(':')
+    if not separator:
+        return address, STATSD_PORT
+    if not host or not port.isdigit() or not 0 < int(port) <= MAX_PORT:
+        raise argparse.ArgumentTypeError(
+            'expected HOST[:PORT], got {0!r}'.format(address),
+        )
+    return host, int(port)
+
+
+def exporters_from_args(args: argparse.Namespace) -> list:
+    """Return metrics exporters requested on command line."""
+    exporters: list = []
+    if args.metrics_file:
+        exporters.append(JsonExporter(args.metrics_file))
+    if args.prometheus_file:
+        exporters.append(PrometheusExporter(args.prometheus_file))
+    if args.statsd:
+        exporters.append(StatsdExporter(*args.statsd))
+    return exporters
+
+
+def run_from_args(args: argparse.Namespace, hash_stream: TextIO) -> None:
+    """Configure logging and run main with command line arguments."""
+    file_level = args.file_log_level
+    configure_logging(
+        getattr(logging, args.log_level),
+        getattr(logging, file_level) if file_level else None,
+        hash_stream,
+    )
+    try:
+        with ManifestWriter(args.checksum_file, args.manifest) as manifest:
+            asyncio.run(main(
+                args.url,
+                client_config_from_args(args),
+                args.mirror,
+                args.discovery,
+                args.mode,
+                HashOptions(tuple(args.algorithms), args.verify_blob),
+                exporters_from_args(args),
+                BlobStore(args.store, args.link_mode) if args.store else None,
+                HttpCache(args.http_cache) if args.http_cache else None,
+                manifest,
+            ))
+    finally:
+        flush_logging()
+
+
 if __name__ == '__main__':
-    host = 'https://gitea.radium.group'
-    host_path = '/api/v1/repos/radium/project-configuration/contents/'
-    url = ''.join((host, host_path))
-    asyncio.run(main(url))
+    args = parse_args()
+    try:
+        if args.hash_output == '-':
+            run_from_args(args, sys.stdout)
+        else:
+            with open(args.hash_output, 'w') as hash_file:
+                run_from_args(args, hash_file)
+    except KeyboardInterrupt:
+        logger.warning('Interrupted.')
+        raise SystemExit(130)
@@ -0,0 +1,277 @@
+"""Write hash manifests while files arrive, verify local tree against them.
+
+Checksum file is compatible with sha256sum, JSON Lines manifest also
+holds size, git blob sha, mtime and timings of every file.
+"""
+
+import argparse
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, TextIO
+
+from downloader import DownloadResult
+from hashing import HashingEngine, engine
+from loggers import LOG_LEVELS, configure_logging, flush_logging, logger
+from sync_index import mirror_path
+
+DOWNLOAD: str = 'download'
+STORE: str = 'store'
+INDEX: str = 'index'
+
+
+def checksum_line(sha256: str, repo_path: str) -> str:
+    """Return sha256sum-style line of single file."""
+    return '{0}  {1}\n'.format(sha256, repo_path)
+
+
+def result_source(download_result: DownloadResult) -> str:
+    """Return where file of given result came from."""
+    if download_result.cached:
+        return INDEX
+    if download_result.from_store:
+        return STORE
+    return DOWNLOAD
+
+
+def _stat(path_to_file: Optional[Path]) -> Optional[os.stat_result]:
+    if path_to_file is None:
+        return None
+    try:
+        return path_to_file.stat()
+    except OSError:
+        return None
+
+
+class ManifestWriter:
+    """Append every finished file to checksum file and JSON Lines manifest.
+
+    Files are line buffered, so manifest of interrupted run lists every
+    file finished before interruption. Either output may be omitted.
+    """
+
+    def __init__(
+        self,
+        checksum_path: Optional[str] = None,
+        jsonl_path: Optional[str] = None,
+    ) -> None:
+        """Remember output files, they are opened on enter."""
+        self.checksum_path = checksum_path
+        self.jsonl_path = jsonl_path
+        self._checksum_file: Optional[TextIO] = None
+        self._jsonl_file: Optional[TextIO] = None
+
+    def __enter__(self) -> 'ManifestWriter':
+        """Open output files, truncating them."""
+        if self.checksum_path:
+            self._checksum_file = open(  # noqa: WPS515
+                self.checksum_path,
+                'w',
+                buffering=1,
+            )
+        if self.jsonl_path:
+            self._jsonl_file = open(  # noqa: WPS515
+                self.jsonl_path,
+                'w',
+                buffering=1,
+            )
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close output files."""
+        for out_file in (self._checksum_file, self._jsonl_file):
+            if out_file is not None:
+                out_file.close()
+        self._checksum_file = None
+        self._jsonl_file = None
+
+    def add(self, download_result: DownloadResult, directory: str) -> None:
+        """Write result of file in given repo directory, failures skipped."""
+        if not download_result.ok:
+            return
+        root = Path(directory).resolve()
+        repo_path = Path(download_result.path).relative_to(root).as_posix()
+        if self._checksum_file is not None:
+            self._checksum_file.write(
+                checksum_line(download_result.sha256, repo_path),
+            )
+        if self._jsonl_file is None:
+            return
+        file_stat = _stat(Path(download_result.path))
+        record = {
+            'path': repo_path,
+            'size': download_result.size,
+            'sha': download_result.blob_sha,
+            'sha256': download_result.sha256,
+            'mtime_ns': file_stat.st_mtime_ns if file_stat else None,
+            'source': result_source(download_result),
+            **download_result.timings,
+        }
+        self._jsonl_file.write('{0}\n'.format(json.dumps(record)))
+
+
+def read_manifest(path: str) -> list:
+    """Return records of JSON Lines manifest or sha256sum-style file.
+
+    Records of checksum file have path and sha256 only.
+    """
+    records = []
+    with open(path) as in_file:
+        for raw_line in in_file:
+            line = raw_line.rstrip('\n')
+            if not line:
+                continue
+            if line.startswith('{'):
+                records.append(json.loads(line))
+                continue
+            sha256, separator, repo_path = line.partition(' ')
+            if not separator or not repo_path:
+                err_msg = 'Bad manifest line: {0}'.format(line)
+                logger.error(err_msg)
+                raise ValueError(err_msg)
+            records.append({'path': repo_path[1:], 'sha256': sha256})
+    return records
+
+
+@dataclass
+class VerifyReport:
+    """Outcome of tree verification."""
+
+    checked: int = 0
+    rehashed: int = 0
+    missing: list = field(default_factory=list)
+    changed: list = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        """Return True if every file matches manifest."""
+        return not self.missing and not self.changed
+
+    def as_dict(self) -> dict:
+        """Return counts of checked, rehashed and bad files."""
+        return {
+            'checked': self.checked,
+            'rehashed': self.rehashed,
+            'missing': len(self.missing),
+            'changed': len(self.changed),
+        }
+
+
+def _stat_pass(
+    directory: str,
+    records: list,
+    hashing_engine: HashingEngine,
+    rehash_all: bool,
+    report: VerifyReport,
+) -> dict:
+    paths = []
+    for record in records:
+        try:
+            paths.append(mirror_path(directory, record['path']))
+        except ValueError:
+            paths.append(None)
+    stats = hashing_engine.thread_pool.map(_stat, paths)
+    suspects = {}
+    for record, path_to_file, file_stat in zip(records, paths, stats):
+        if file_stat is None:
+            report.missing.append(record['path'])
+        elif record.get('size', file_stat.st_size) != file_stat.st_size:
+            report.changed.append(record['path'])
+        elif rehash_all or record.get('mtime_ns') != file_stat.st_mtime_ns:
+            suspects[str(path_to_file)] = record
+    return suspects
+
+
+def _rehash_pass(
+    suspects: dict,
+    hashing_engine: HashingEngine,
+    report: VerifyReport,
+) -> None:
+    report.rehashed = len(suspects)
+    for path_to_file, sha256 in hashing_engine.hash_files(suspects):
+        if sha256 != suspects[path_to_file]['sha256']:
+            report.changed.append(suspects[path_to_file]['path'])
+
+
+def verify_tree(
+    directory: str,
+    records: list,
+    hashing_engine: Optional[HashingEngine] = None,
+    rehash_all: bool = False,
+) -> VerifyReport:
+    """Check files in directory against manifest records.
+
+    File of other size is changed. File with recorded size and mtime is
+    trusted unless rehash_all is set, others are rehashed in parallel
+    by hashing engine. Files not listed in manifest are ignored.
+    """
+    if hashing_engine is None:
+        hashing_engine = engine
+    report = VerifyReport(checked=len(records))
+    suspects = _stat_pass(
+        directory,
+        records,
+        hashing_engine,
+        rehash_all,
+        report,
+    )
+    _rehash_pass(suspects, hashing_engine, report)
+    return report
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    """Parse command line arguments of verification."""
+    parser = argparse.ArgumentParser(
+        description='Verify local directory against hash manifest.',
+    )
+    parser.add_argument('directory', help='directory to verify')
+    parser.add_argument(
+        'manifest',
+        help='JSON Lines manifest or sha256sum-style checksum file',
+    )
+    parser.add_argument(
+        '--rehash-all',
+        action='store_true',
+        help='rehash files even if their size and mtime match',
+    )
+    parser.add_argument(
+        '--log-level',
+        choices=LOG_LEVELS,
+        default='INFO',
+        help='level of log messages',
+    )
+    return parser.parse_args(argv)
+
+
+def verify_from_args(args: argparse.Namespace) -> bool:
+    """Verify directory given on command line, log bad files."""
+    report = verify_tree(
+        args.directory,
+        read_manifest(args.manifest),
+        rehash_all=args.rehash_all,
+    )
+    for repo_path in report.missing:
+        msg = 'Missing: {0}'.format(repo_path)
+        logger.warning(msg)
+    for repo_path in report.changed:
+        msg = 'Changed: {0}'.format(repo_path)
+        logger.warning(msg)
+    msg = 'Verified: {0}'.format(report.as_dict())
+    logger.info(msg)
+    return report.ok
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    configure_logging(getattr(logging, args.log_level), hash_stream=None)
+    try:
+        verified = verify_from_args(args)
+    except (OSError, ValueError) as err:
+        msg = 'Verification failed: {0!r}'.format(err)
+        logger.error(msg)
+        verified = False
+    finally:
+        flush_logging()
+    raise SystemExit(0 if verified else 1)
@@ -0,0 +1,416 @@
+"""Collect pipeline metrics and export them as JSON, Prometheus or StatsD."""
+
+import bisect
+import json
+import socket
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Iterator, Optional, Protocol, Sequence
+
+from aiohttp import (
+    ClientSession,
+    TraceConfig,
+    TraceConnectionCreateEndParams,
+    TraceConnectionCreateStartParams,
+    TraceConnectionQueuedEndParams,
+    TraceConnectionQueuedStartParams,
+    TraceConnectionReuseconnParams,
+    TraceDnsResolveHostEndParams,
+    TraceDnsResolveHostStartParams,
+    TraceRequestEndParams,
+    TraceRequestExceptionParams,
+    TraceRequestStartParams,
+)
+
+TIME_BUCKETS: tuple = tuple(0.0001 * 2 ** power for power in range(21))
+SIZE_BUCKETS: tuple = tuple(256 * 4 ** power for power in range(12))
+PERCENTILES: tuple = (50, 90, 99)
+PROMETHEUS_PREFIX: str = 'radium'
+STATSD_PACKET_SIZE: int = 512
+STATSD_PORT: int = 8125
+
+
+class Histogram:
+    """Bucketed histogram with percentile estimates.
+
+    Memory does not depend on number of observations, percentiles are
+    interpolated within bucket and clamped to observed extremes.
+    """
+
+    def __init__(self, buckets: Sequence[float] = TIME_BUCKETS) -> None:
+        """Create empty histogram with given upper bucket bounds."""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value_: float) -> None:
+        """Add single observation."""
+        self.counts[bisect.bisect_left(self.buckets, value_)] += 1
+        self.count += 1
+        self.total += value_
+        if self.min is None or value_ < self.min:
+            self.min = value_
+        if self.max is None or value_ > self.max:
+            self.max = value_
+
+    def percentile(self, percent: float) -> float:
+        """Return estimated value below which given percent falls."""
+        if not self.count:
+            return 0
+        rank = percent / 100 * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else self.min
+                upper = (
+                    self.buckets[index]
+                    if index < len(self.buckets) else self.max
+                )
+                lower = max(lower, self.min)
+                upper = min(upper, self.max)
+                share = (rank - cumulative) / bucket_count
+                return lower + (upper - lower) * share
+            cumulative += bucket_count
+        return self.max
+
+    def summary(self) -> dict:
+        """Return count, sum, extremes and percentiles."""
+        summary = {
+            'count': self.count,
+            'sum': round(self.total, 6),
+            'min': round(self.min or 0, 6),
+            'max': round(self.max or 0, 6),
+            'mean': round(self.total / self.count, 6) if self.count else 0,
+        }
+        for percent in PERCENTILES:
+            summary['p{0}'.format(percent)] = round(
+                self.percentile(percent),
+                6,
+            )
+        return summary
+
+
+class MetricsRegistry:
+    """Named counters and histograms of single run."""
+
+    def __init__(self) -> None:
+        """Create empty registry."""
+        self.counters: dict = {}
+        self.histograms: dict = {}
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        """Add amount to counter."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(
+        self,
+        name: str,
+        value_: float,
+        buckets: Sequence[float] = TIME_BUCKETS,
+    ) -> None:
+        """Add observation to histogram, creating it on first use."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = Histogram(buckets)
+            self.histograms[name] = histogram
+        histogram.observe(value_)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Observe duration of with block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def reset(self) -> None:
+        """Drop all collected metrics."""
+        self.counters.clear()
+        self.histograms.clear()
+
+    def time_split(self) -> dict:
+        """Return share of download time spent on network, disk and hashing.
+
+        Network time is download time left after writing and hashing.
+        """
+        totals = dict.fromkeys(
+            ('download_seconds', 'write_seconds', 'hash_seconds'),
+            0,
+        )
+        for name in totals:
+            if name in self.histograms:
+                totals[name] = self.histograms[name].total
+        download_time = totals['download_seconds']
+        if not download_time:
+            return {}
+        local_time = totals['write_seconds'] + totals['hash_seconds']
+        network_time = max(download_time - local_time, 0)
+        return {
+            'network': round(network_time / download_time, 3),
+            'disk_write': round(totals['write_seconds'] / download_time, 3),
+            'hash': round(totals['hash_seconds'] / download_time, 3),
+        }
+
+    def report(self) -> dict:
+        """Return counters, histogram summaries and time split."""
+        return {
+            'counters': dict(sorted(self.counters.items())),
+            'histograms': {
+                name: histogram.summary()
+                for name, histogram in sorted(self.histograms.items())
+            },
+            'time_split': self.time_split(),
+        }
+
+
+registry = MetricsRegistry()
+
+
+class TraceRecorder:
+    """Record request timings reported by aiohttp tracing signals."""
+
+    def __init__(self, metrics: MetricsRegistry = registry) -> None:
+        """Record into given registry."""
+        self.metrics = metrics
+
+    async def on_request_start(
+        self,
+        session: ClientSession,
+        ctx: SimpleNamespace,
+        params: TraceRequestStartParams,
+    ) -> None:
+        """Count request, remember its start."""
+        ctx.request_start = time.perf_counter()
+        self.metrics.increment('requests')
+
+    async def on_request_end(
+        self,
+        session: ClientSession,
+        ctx: SimpleNamespace,
+        params: TraceRequestEndParams,
+    ) -> None:
+        """Record time to response headers."""
+        self.metrics.observe(
+            'ttfb_seconds',
+            time.perf_counter() - ctx.request_start,
+        )
+
+    async def on_request_exception(
+        self,
+        session: ClientSession,
+        ctx: SimpleNamespace,
+        params: TraceRequestExceptionParams,
+    ) -> None:
+        """Count failed request."""
+        self.metrics.increment('request_errors')
+
+    async def on_queued_start(
+        self,
+        session: ClientSession,
+        ctx: SimpleNamespace,
+        params: TraceConnectionQueuedStartParams,
+    ) -> None:
+        """Remember start of wait for pooled connection."""
+        ctx.queued_start = time.perf_counter()
+
+    async def on_queued_end(
+        self,
+        session: ClientSession,
+        ctx: SimpleNamespace,
+        params: TraceConnectionQueuedEndParams,
+    ) -> None:
+        """Record wait for pooled connection."""
+        self.metrics.observe(
+            'pool_wait_seconds',
+            time.perf_counter() - ctx.queued_start,
+        )
+
+    async def on_connect_start(
+        self,
+        session: ClientSession,
+        ctx: SimpleNamespace,
+        params: TraceConnectionCreateStartParams,
+    ) -> None:
+        """Remember start of new connection."""
+        ctx.connect_start = time.perf_counter()
+
+    async def on_connect_end(
+        self,
+        session: ClientSession,
+        ctx: SimpleNamespace,
+        params: TraceConnectionCreateEndParams,
+    ) -> None:
+        """Record connect duration, count created connection."""
+        self.metrics.observe(
+            'connect_seconds',
+            time.perf_counter() - ctx.connect_start,
+        )
+        self.metrics.increment('connections_created')
+
+    async def on_reuse(
+        self,
+        session: ClientSession,
+        ctx: SimpleNamespace,
+        params: TraceConnectionReuseconnParams,
+    ) -> None:
+        """Count reused connection."""
+        self.metrics.increment('connections_reused')
+
+    async def on_dns_start(
+        self,
+        session: ClientSession,
+        ctx: SimpleNamespace,
+        params: TraceDnsResolveHostStartParams,
+    ) -> None:
+        """Remember start of DNS resolution."""
+        ctx.dns_start = time.perf_counter()
+
+    async def on_dns_end(
+        self,
+        session: ClientSession,
+        ctx: SimpleNamespace,
+        params: TraceDnsResolveHostEndParams,
+    ) -> None:
+        """Record DNS resolution duration."""
+        self.metrics.observe(
+            'dns_seconds',
+            time.perf_counter() - ctx.dns_start,
+        )
+
+
+def make_trace_config(
+    metrics: MetricsRegistry = registry,
+) -> TraceConfig:
+    """Return trace config recording DNS, connect and TTFB durations.
+
+    Time to first byte is measured from request start to response
+    headers, so it includes waiting for pooled connection.
+    """
+    recorder = TraceRecorder(metrics)
+    trace_config = TraceConfig()
+    trace_config.on_request_start.append(recorder.on_request_start)
+    trace_config.on_request_end.append(recorder.on_request_end)
+    trace_config.on_request_exception.append(recorder.on_request_exception)
+    trace_config.on_connection_queued_start.append(recorder.on_queued_start)
+    trace_config.on_connection_queued_end.append(recorder.on_queued_end)
+    trace_config.on_connection_create_start.append(recorder.on_connect_start)
+    trace_config.on_connection_create_end.append(recorder.on_connect_end)
+    trace_config.on_connection_reuseconn.append(recorder.on_reuse)
+    trace_config.on_dns_resolvehost_start.append(recorder.on_dns_start)
+    trace_config.on_dns_resolvehost_end.append(recorder.on_dns_end)
+    return trace_config
+
+
+def to_prometheus(
+    metrics: MetricsRegistry = registry,
+    prefix: str = PROMETHEUS_PREFIX,
+) -> str:
+    """Return metrics in Prometheus text exposition format."""
+    lines = []
+    for name, counter in sorted(metrics.counters.items()):
+        metric_name = '{0}_{1}_total'.format(prefix, name)
+        lines.append('# TYPE {0} counter'.format(metric_name))
+        lines.append('{0} {1}'.format(metric_name, counter))
+    for name, histogram in sorted(metrics.histograms.items()):
+        metric_name = '{0}_{1}'.format(prefix, name)
+        lines.append('# TYPE {0} histogram'.format(metric_name))
+        cumulative = 0
+        bounds = [*histogram.buckets, '+Inf']
+        for bound, bucket_count in zip(bounds, histogram.counts):
+            cumulative += bucket_count
+            lines.append('{0}_bucket{{le="{1}"}} {2}'.format(
+                metric_name,
+                bound,
+                cumulative,
+            ))
+        lines.append('{0}_sum {1}'.format(metric_name, histogram.total))
+        lines.append('{0}_count {1}'.format(metric_name, histogram.count))
+    return '\n'.join(lines) + '\n'
+
+
+def to_statsd(
+    metrics: MetricsRegistry = registry,
+    prefix: str = PROMETHEUS_PREFIX,
+) -> list:
+    """Return StatsD lines, counters as counts, percentiles as gauges."""
+    lines = [
+        '{0}.{1}:{2}|c'.format(prefix, name, counter)
+        for name, counter in sorted(metrics.counters.items())
+    ]
+    for name, histogram in sorted(metrics.histograms.items()):
+        for stat, stat_value in histogram.summary().items():
+            lines.append('{0}.{1}.{2}:{3}|g'.format(
+                prefix,
+                name,
+                stat,
+                stat_value,
+            ))
+    return lines
+
+
+class Exporter(Protocol):
+    """Destination of metrics collected during run."""
+
+    def export(self, metrics: MetricsRegistry) -> None:
+        """Publish metrics of given registry."""
+
+
+class JsonExporter:
+    """Write JSON report to file."""
+
+    def __init__(self, path: str) -> None:
+        """Remember target file."""
+        self.path = path
+
+    def export(self, metrics: MetricsRegistry) -> None:
+        """Write report of given registry."""
+        with open(self.path, 'w') as out_file:
+            json.dump(metrics.report(), out_file, indent=2)
+
+
+class PrometheusExporter:
+    """Write Prometheus text file, e.g. for textfile collector."""
+
+    def __init__(self, path: str, prefix: str = PROMETHEUS_PREFIX) -> None:
+        """Remember target file and metric name prefix."""
+        self.path = path
+        self.prefix = prefix
+
+    def export(self, metrics: MetricsRegistry) -> None:
+        """Write metrics of given registry."""
+        with open(self.path, 'w') as out_file:
+            out_file.write(to_prometheus(metrics, self.prefix))
+
+
+class StatsdExporter:
+    """Send metrics to StatsD over UDP."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int = STATSD_PORT,
+        prefix: str = PROMETHEUS_PREFIX,
+    ) -> None:
+        """Remember StatsD address and metric name prefix."""
+        self.address = (host, port)
+        self.prefix = prefix
+
+    def export(self, metrics: MetricsRegistry) -> None:
+        """Send metrics of given registry in packets of limited size."""
+        packets = []
+        packet = ''
+        for line in to_statsd(metrics, self.prefix):
+            if packet and len(packet) + len(line) >= STATSD_PACKET_SIZE:
+                packets.append(packet)
+                packet = ''
+            packet = '{0}\n{1}'.format(packet, line) if packet else line
+        if packet:
+            packets.append(packet)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for packet_data in packets:
+                sock.sendto(packet_data.encode(), self.address)
@@ -0,0 +1,99 @@
+"""Run jobs on fixed pool of long-lived worker tasks."""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, Awaitable, Callable, TypeVar
+
+from downloader import DownloadResult
+
+JobT = TypeVar('JobT')
+QUEUE_SIZE_FACTOR: int = 2
+
+_STOP = object()
+
+
+@dataclass
+class RunSummary:
+    """Totals of single download run."""
+
+    downloaded: int = 0
+    failed: int = 0
+    cached: int = 0
+    linked: int = 0
+    bytes_downloaded: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    elapsed: float = 0
+    failures: list = field(default_factory=list)
+
+    def add(self, download_result: DownloadResult) -> None:
+        """Account result of single download."""
+        if download_result.cached:
+            self.cached += 1
+        elif download_result.from_store:
+            self.linked += 1
+        elif download_result.ok:
+            self.downloaded += 1
+            self.bytes_downloaded += download_result.size
+        else:
+            self.failed += 1
+            self.failures.append(download_result)
+
+    def finish(self) -> None:
+        """Record run duration."""
+        self.elapsed = time.monotonic() - self.started_at
+
+    def as_dict(self) -> dict:
+        """Return summary without per-file details."""
+        return {
+            'downloaded': self.downloaded,
+            'failed': self.failed,
+            'cached': self.cached,
+            'linked': self.linked,
+            'bytes': self.bytes_downloaded,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+
+async def run_pool(
+    jobs: AsyncIterable[JobT],
+    handle: Callable[[JobT], Awaitable[None]],
+    worker_num: int,
+    queue_size: int = 0,
+) -> int:
+    """Feed jobs to worker_num workers through bounded queue.
+
+    Only workers and queued jobs exist at any moment, so memory does not
+    grow with number of jobs. First error of producer or any worker, as
+    well as cancellation, stops all of them. Return number of jobs.
+    """
+    worker_num = max(worker_num, 1)
+    queue: asyncio.Queue = asyncio.Queue(
+        maxsize=queue_size or QUEUE_SIZE_FACTOR * worker_num,
+    )
+
+    async def feed() -> int:  # noqa: WPS430
+        job_count = 0
+        async for job in jobs:
+            await queue.put(job)
+            job_count += 1
+        for _ in range(worker_num):
+            await queue.put(_STOP)
+        return job_count
+
+    async def work() -> None:  # noqa: WPS430
+        while True:
+            job = await queue.get()
+            if job is _STOP:
+                return
+            await handle(job)
+
+    producer = asyncio.create_task(feed())
+    workers = [asyncio.create_task(work()) for _ in range(worker_num)]
+    try:
+        await asyncio.gather(producer, *workers)
+    finally:
+        for task in (producer, *workers):
+            task.cancel()
+        await asyncio.gather(producer, *workers, return_exceptions=True)
+    return producer.result()
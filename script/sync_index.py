@@ -0,0 +1,103 @@
+"""Keep on-disk index of files mirrored from remote repository."""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from link_extractor import RepoFile
+from loggers import logger
+
+INDEX_FILENAME: str = '.radium-index.json'
+
+
+class IndexEntry(NamedTuple):
+    """Mirrored file state."""
+
+    sha: str
+    sha256: str
+    size: Optional[int] = None
+
+
+def mirror_path(directory: str, repo_path: str) -> Path:
+    """Return local path of repo file, refusing paths outside directory."""
+    root = Path(directory).resolve()
+    path_to_file = (root / repo_path).resolve()
+    if root not in path_to_file.parents:
+        err_msg = 'Unsafe repo path: {0}'.format(repo_path)
+        logger.error(err_msg)
+        raise ValueError(err_msg)
+    return path_to_file
+
+
+class SyncIndex:
+    """Map of repo path to git blob sha and sha256 of mirrored file."""
+
+    def __init__(self, directory: str) -> None:
+        """Create empty index stored in given mirror directory."""
+        self.directory = directory
+        self.entries: dict[str, IndexEntry] = {}
+        self.seen: set[str] = set()
+
+    @property
+    def index_path(self) -> Path:
+        """Return path of index file."""
+        return Path(self.directory) / INDEX_FILENAME
+
+    @classmethod
+    def load(cls, directory: str) -> 'SyncIndex':
+        """Load index from mirror directory, empty if there is none."""
+        index = cls(directory)
+        try:
+            with open(index.index_path) as in_file:
+                raw_entries = json.load(in_file)
+        except FileNotFoundError:
+            return index
+        except (OSError, ValueError):
+            logger.error('Index is unreadable, full sync will be done.')
+            return index
+        index.entries = {
+            repo_path: IndexEntry(**entry)
+            for repo_path, entry in raw_entries.items()
+        }
+        return index
+
+    def lookup(self, repo_file: RepoFile) -> Optional[IndexEntry]:
+        """Return index entry if mirrored file is up to date."""
+        self.seen.add(repo_file.path)
+        entry = self.entries.get(repo_file.path)
+        if entry is None or not repo_file.sha or entry.sha != repo_file.sha:
+            return None
+        if not mirror_path(self.directory, repo_file.path).is_file():
+            return None
+        return entry
+
+    def update(self, repo_file: RepoFile, sha256: str) -> None:
+        """Record freshly downloaded file."""
+        self.seen.add(repo_file.path)
+        self.entries[repo_file.path] = IndexEntry(
+            sha=repo_file.sha or '',
+            sha256=sha256,
+            size=repo_file.size,
+        )
+
+    def prune(self, delete_files: bool) -> None:
+        """Forget files missing upstream, optionally deleting them."""
+        for repo_path in set(self.entries) - self.seen:
+            del self.entries[repo_path]  # noqa: WPS420
+            if delete_files:
+                path_to_file = mirror_path(self.directory, repo_path)
+                path_to_file.unlink(missing_ok=True)
+
+    def save(self) -> None:
+        """Write index atomically next to mirrored files."""
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        raw_entries = {
+            repo_path: entry._asdict()
+            for repo_path, entry in sorted(self.entries.items())
+        }
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as out_file:
+            json.dump(raw_entries, out_file, indent=1)
+        os.replace(tmp_name, self.index_path)
@@ -0,0 +1,46 @@
+"""Tests for archive download mode."""
+
+import hashlib
+from collections import Counter
+from pathlib import Path
+
+import pytest
+from aiohttp import ClientSession
+from archive import fetch_archive
+from benchmarks.gitea_stub import CONTENTS_PATH, create_repo_app
+from loggers import hash_logger
+
+repo_files: dict = {
+    'README.md': b'readme',
+    'nitpick/all.toml': b'[nitpick]\n',
+    'nitpick/deep/flake8.toml': b'[flake8]\n',
+}
+
+
+@pytest.mark.asyncio()
+async def test_fetch_archive_extracts_and_hashes(
+    aiohttp_server,
+    tmp_path: Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """Test archive members are extracted and hashed in single request."""
+    hits: Counter = Counter()
+    server = await aiohttp_server(create_repo_app(repo_files, hits))
+    url = str(server.make_url('{0}nitpick'.format(CONTENTS_PATH)))
+
+    hash_logger.addHandler(caplog.handler)
+    try:
+        async with ClientSession() as session:
+            file_count = await fetch_archive(url, str(tmp_path), session)
+    finally:
+        hash_logger.removeHandler(caplog.handler)
+
+    assert file_count == 2
+    assert hits['archive'] == 1
+    extracted = tmp_path / 'nitpick' / 'deep' / 'flake8.toml'
+    assert extracted.read_bytes() == b'[flake8]\n'
+    expected_line = '{0}  {1}'.format(
+        hashlib.sha256(b'[nitpick]\n').hexdigest(),
+        tmp_path / 'nitpick' / 'all.toml',
+    )
+    assert expected_line in caplog.messages
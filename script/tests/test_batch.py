@@ -0,0 +1,147 @@
+"""Tests for batch sync of many repos."""
+
+import asyncio
+import hashlib
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from aiohttp import web
+from batch import BatchSync, entry_name, load_manifest, main
+from benchmarks.gitea_stub import CONTENTS_PATH, create_repo_app
+from client_config import ClientConfig
+from limiter import FairBudget
+
+
+def test_manifest_entries(tmp_path: Path) -> None:
+    """Test URLs and objects are accepted and named by repo and ref."""
+    url = 'https://git.example.com/api/v1/repos/org/conf/contents/'
+    manifest_path = tmp_path / 'repos.json'
+    manifest_path.write_text(json.dumps([
+        url,
+        {'url': url, 'ref': 'dev'},
+        {'url': '{0}nitpick'.format(url), 'name': 'nitpick'},
+    ]))
+
+    entries = load_manifest(str(manifest_path))
+
+    assert [batch_entry.name for batch_entry in entries] == [
+        'git.example.com/org/conf',
+        'git.example.com/org/conf@dev',
+        'nitpick',
+    ]
+    assert entries[1].ref_url == '{0}?ref=dev'.format(url)
+    assert entries[0].host == 'https://git.example.com'
+    tagged_url = '{0}?ref=v1'.format(url)
+    assert entry_name(tagged_url) == 'git.example.com/org/conf@v1'
+    manifest_path.write_text(json.dumps([url, url]))
+    with pytest.raises(ValueError, match='Duplicate'):
+        load_manifest(str(manifest_path))
+    manifest_path.write_text(json.dumps([url, '{0}nitpick'.format(url)]))
+    with pytest.raises(ValueError, match='nested'):
+        load_manifest(str(manifest_path))
+
+
+@pytest.mark.asyncio()
+async def test_host_limit_grows_to_budget(tmp_path: Path) -> None:
+    """Test single host may use whole budget, not just its concurrency."""
+    async with BatchSync(ClientConfig(), str(tmp_path), budget=16) as batch:
+        limiter = batch.limiter('https://git.example.com')
+        session = await batch.session('https://git.example.com')
+
+        assert limiter.max_limit == 16
+        assert limiter.limiter.limit == ClientConfig().concurrency
+        assert session.connector.limit_per_host >= 16
+
+
+@pytest.mark.asyncio()
+async def test_budget_is_shared_round_robin() -> None:
+    """Test hosts waiting for budget get free slots in turn."""
+    budget = FairBudget(1)
+    order: list = []
+    await budget.acquire('busy')
+
+    async def take(key: str) -> None:
+        await budget.acquire(key)
+        order.append(key)
+        budget.release()
+
+    tasks = [
+        asyncio.create_task(take(key))
+        for key in ('busy', 'busy', 'busy', 'quiet')
+    ]
+    await asyncio.sleep(0)
+    budget.release()
+    await asyncio.gather(*tasks)
+
+    assert order == ['busy', 'quiet', 'busy', 'busy']
+
+
+@pytest.mark.asyncio()
+async def test_batch_writes_manifest_per_repo(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test repos of two hosts are synced into separate hash manifests."""
+    first_files = {'a.txt': b'a', 'dir/b.txt': b'b'}
+    second_files = {'c.txt': b'c'}
+    hits: Counter = Counter()
+    first = await aiohttp_server(create_repo_app(first_files, hits))
+    second = await aiohttp_server(create_repo_app(second_files, hits))
+    entries = load_manifest_from(tmp_path, [
+        {'url': str(first.make_url(CONTENTS_PATH)), 'name': 'first'},
+        {'url': str(second.make_url(CONTENTS_PATH)), 'name': 'second'},
+        {'url': str(first.make_url(CONTENTS_PATH + 'missing')), 'name': 'x'},
+    ])
+
+    failed = await main(
+        entries,
+        str(tmp_path / 'out'),
+        budget=2,
+        mirror_root=str(tmp_path / 'mirror'),
+    )
+
+    assert failed == ['x']
+    assert hits['raw'] == 3
+    assert (tmp_path / 'out' / 'first.sha256').read_text().splitlines() == [
+        '{0}  a.txt'.format(hashlib.sha256(b'a').hexdigest()),
+        '{0}  dir/b.txt'.format(hashlib.sha256(b'b').hexdigest()),
+    ]
+    assert (tmp_path / 'mirror' / 'second' / 'c.txt').read_bytes() == b'c'
+
+
+@pytest.mark.asyncio()
+async def test_repo_with_failed_downloads_fails(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test repo is reported failed when its files can not be downloaded."""
+    app = create_repo_app({'a.txt': b'a'})
+
+    @web.middleware
+    async def forbid_raw(  # noqa: WPS430
+        request: web.Request,
+        handler: Callable,
+    ) -> web.Response:
+        if '/raw/' in request.path:
+            raise web.HTTPForbidden()
+        return await handler(request)
+
+    app.middlewares.append(forbid_raw)
+    server = await aiohttp_server(app)
+    entries = load_manifest_from(tmp_path, [
+        {'url': str(server.make_url(CONTENTS_PATH)), 'name': 'repo'},
+    ])
+
+    failed = await main(entries, str(tmp_path / 'out'))
+
+    assert failed == ['repo']
+
+
+def load_manifest_from(tmp_path: Path, raw_entries: list) -> list:
+    """Write raw entries to manifest file and load it."""
+    manifest_path = tmp_path / 'repos.json'
+    manifest_path.write_text(json.dumps(raw_entries))
+    return load_manifest(str(manifest_path))
@@ -0,0 +1,60 @@
+"""Tests for synthetic server and pipeline benchmark."""
+
+import downloader
+import pytest
+from benchmarks.bench_pipeline import run_benchmark
+from benchmarks.gitea_stub import CONTENTS_PATH
+from benchmarks.synthetic import (
+    NetworkProfile,
+    TreeShape,
+    create_synthetic_app,
+    make_tree,
+)
+from client_config import ClientConfig
+
+
+def test_tree_shape() -> None:
+    """Test files are spread over every directory of given depth."""
+    shape = TreeShape(depth=2, fan_out=3, file_count=26, size_sigma=0)
+    files = make_tree(shape)
+
+    assert len(shape.dir_paths()) == 13
+    assert len(files) == 26
+    assert {len(content) for content in files.values()} == {shape.mean_size}
+    assert 'd2/d1/file11.bin' in files
+    assert make_tree(shape) == files
+
+
+@pytest.mark.asyncio()
+async def test_benchmark_report(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test all phases are measured and injected errors are retried."""
+    monkeypatch.setattr(downloader, 'BACKOFF_BASE', 0)
+    shape = TreeShape(depth=1, fan_out=2, file_count=12, mean_size=1024)
+    profile = NetworkProfile(latency=0, bandwidth=10 ** 6, error_rate=0.2)
+
+    report = await run_benchmark(shape, profile, ClientConfig(concurrency=4))
+
+    assert report['files'] == 12
+    assert report['discovery']['files'] == 12
+    assert report['discovery']['round_trips'] == 3
+    assert report['download']['failed'] == 0
+    assert report['download']['file_requests'] == 12
+    assert report['download']['files_per_sec'] > 0
+    assert report['hashing']['mb_per_sec'] > 0
+    assert report['peak_rss_mb'] > 0
+
+
+@pytest.mark.asyncio()
+async def test_throttled_listing_keeps_etag(aiohttp_client) -> None:
+    """Test bandwidth cap does not break conditional listing requests."""
+    profile = NetworkProfile(latency=0, bandwidth=10 ** 6)
+    client = await aiohttp_client(
+        create_synthetic_app({'a.txt': b'a'}, profile),
+    )
+
+    response = await client.get(CONTENTS_PATH)
+    etag = response.headers['ETag']
+    again = await client.get(CONTENTS_PATH, headers={'If-None-Match': etag})
+
+    assert response.status == 200
+    assert again.status == 304
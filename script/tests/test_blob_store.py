@@ -0,0 +1,149 @@
+"""Tests for content-addressed blob store."""
+
+import logging
+import os
+import stat
+from collections import Counter
+from pathlib import Path
+from typing import AsyncIterator
+
+import pytest
+from aiohttp import ClientSession
+from benchmarks.gitea_stub import CONTENTS_PATH, blob_sha, create_repo_app
+from blob_store import COPY, BlobStore
+from link_extractor import RepoFile, walk_repo
+from main import main, run_tasks
+
+shared_files: dict = {
+    'README.md': b'same',
+    'docs/README.md': b'same',
+    'src/app.py': b'print(1)\n',
+}
+
+
+@pytest.mark.asyncio()
+async def test_shared_blobs_downloaded_once(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test same-named and identical files keep layout, blob is fetched once.
+
+    Second run in another directory links everything from store.
+    """
+    hits: Counter = Counter()
+    server = await aiohttp_server(create_repo_app(shared_files, hits))
+    url = str(server.make_url(CONTENTS_PATH))
+    store = BlobStore(str(tmp_path / 'store'))
+
+    async with ClientSession() as session:
+        first = await run_tasks(
+            walk_repo(url, session),
+            str(tmp_path / 'first'),
+            session,
+            3,
+            store=store,
+        )
+        second = await run_tasks(
+            walk_repo(url, session),
+            str(tmp_path / 'second'),
+            session,
+            3,
+            store=store,
+        )
+
+    assert hits['raw'] == 2
+    assert (first.downloaded, first.linked) == (2, 1)
+    assert (second.downloaded, second.linked) == (0, 3)
+    for repo_path, content in shared_files.items():
+        assert (tmp_path / 'first' / repo_path).read_bytes() == content
+        assert (tmp_path / 'second' / repo_path).read_bytes() == content
+    first_readme = os.stat(tmp_path / 'first' / 'README.md')
+    second_readme = os.stat(tmp_path / 'second' / 'docs' / 'README.md')
+    assert first_readme.st_ino == second_readme.st_ino
+    objects = [
+        path for path in (tmp_path / 'store' / 'objects').rglob('*')
+        if path.is_file()
+    ]
+    assert len(objects) == 2
+
+
+async def listed_files(files: list) -> AsyncIterator[RepoFile]:
+    """Yield files listed before."""
+    for repo_file in files:
+        yield repo_file
+
+
+@pytest.mark.asyncio()
+async def test_ref_needs_matching_content(
+    aiohttp_server,
+    tmp_path: Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """Test file changed after listing is stored without blob ref."""
+    files = {'a.txt': b'old'}
+    server = await aiohttp_server(create_repo_app(files))
+    store = BlobStore(str(tmp_path / 'store'))
+
+    async with ClientSession() as session:
+        repo_files = [
+            repo_file
+            async for repo_file in walk_repo(
+                str(server.make_url(CONTENTS_PATH)),
+                session,
+            )
+        ]
+        files['a.txt'] = b'new'
+        with caplog.at_level(logging.WARNING):
+            summary = await run_tasks(
+                listed_files(repo_files),
+                str(tmp_path / 'mirror'),
+                session,
+                1,
+                store=store,
+            )
+
+    assert summary.downloaded == 1
+    assert store.lookup(blob_sha(b'old')) is None
+    assert store.lookup(blob_sha(b'new')) is None
+    assert 'Blob ref not stored' in caplog.text
+
+
+@pytest.mark.asyncio()
+async def test_read_only_mirror_files_are_replaced(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test mirror sync updates and prunes files hardlinked from store."""
+    files = {'a.txt': b'a', 'b.txt': b'b'}
+    server = await aiohttp_server(create_repo_app(files))
+    url = str(server.make_url(CONTENTS_PATH))
+    mirror = tmp_path / 'mirror'
+    store = BlobStore(str(tmp_path / 'store'))
+
+    await main(url, mirror_dir=str(mirror), store=store)
+    assert not os.stat(mirror / 'a.txt').st_mode & stat.S_IWUSR
+    files['a.txt'] = b'changed'
+    files.pop('b.txt')
+    await main(url, mirror_dir=str(mirror), store=store)
+
+    assert (mirror / 'a.txt').read_bytes() == b'changed'
+    assert not (mirror / 'b.txt').exists()
+    assert store.lookup(blob_sha(b'changed')) is not None
+
+
+def test_copy_mode_keeps_files_independent(tmp_path: Path) -> None:
+    """Test copy mode stores separate file and maps blob sha to sha256."""
+    store = BlobStore(str(tmp_path / 'store'), COPY)
+    path_to_file = tmp_path / 'file.txt'
+    path_to_file.write_bytes(b'data')
+
+    store.add(path_to_file, 'ab' * 32, 'cd' * 20)
+    store.materialize('ab' * 32, tmp_path / 'copy' / 'file.txt')
+
+    assert store.lookup('cd' * 20) == 'ab' * 32
+    assert store.lookup('ef' * 20) is None
+    copied = os.stat(tmp_path / 'copy' / 'file.txt')
+    assert copied.st_ino != os.stat(store.object_path('ab' * 32)).st_ino
+    assert (tmp_path / 'copy' / 'file.txt').read_bytes() == b'data'
+    with pytest.raises(ValueError, match='Unknown link mode'):
+        BlobStore(str(tmp_path), 'symlink')
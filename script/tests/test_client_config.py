@@ -0,0 +1,52 @@
+"""Tests for HTTP client configuration."""
+
+import json
+from pathlib import Path
+
+import pytest
+from client_config import ClientConfig, load_client_config
+from main import client_config_from_args, parse_args
+
+
+@pytest.mark.asyncio()
+async def test_pool_limits_follow_concurrency() -> None:
+    """Test pool size defaults to sum of download and listing slots."""
+    config = ClientConfig(concurrency=10, dir_concurrency=4)
+
+    connector = config.make_connector()
+    await connector.close()
+
+    assert connector.limit == 14
+    assert connector.limit_per_host == 14
+
+
+def test_cli_overrides_config_file(tmp_path: Path) -> None:
+    """Test command line options take precedence over config file."""
+    config_path = tmp_path / 'client.json'
+    config_path.write_text(json.dumps({
+        'concurrency': 20,
+        'limit_per_host': 5,
+        'compression': True,
+    }))
+
+    args = parse_args([
+        '--config',
+        str(config_path),
+        '-c',
+        '7',
+        '--no-compression',
+    ])
+    config = client_config_from_args(args)
+
+    assert config.concurrency == 7
+    assert config.limit_per_host == 5
+    assert not config.compression
+
+
+def test_unknown_config_field_rejected(tmp_path: Path) -> None:
+    """Test typo in config file is reported."""
+    config_path = tmp_path / 'client.json'
+    config_path.write_text(json.dumps({'concurency': 20}))
+
+    with pytest.raises(ValueError, match='concurency'):
+        load_client_config(str(config_path))
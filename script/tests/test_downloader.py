@@ -0,0 +1,221 @@
+"""Tests for retrying and resumable downloads."""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Optional
+
+import downloader
+import pytest
+from aiohttp import ClientSession, web
+from aux_utils import ALGORITHMS, GIT_BLOB_SHA1, SHA256, hash_file
+from benchmarks.gitea_stub import blob_sha
+from downloader import HashOptions, download_file
+
+content: bytes = bytes(range(256)) * 40
+ETAG: str = '"v1"'
+
+
+def create_flaky_app(failures: int, seen_ranges: list) -> web.Application:
+    """Return app failing given number of times before serving content."""
+    attempts = {'count': 0}
+
+    async def serve(request: web.Request) -> web.Response:
+        attempts['count'] += 1
+        if attempts['count'] <= failures:
+            return web.Response(status=503, headers={'Retry-After': '0'})
+        range_header = request.headers.get('Range')
+        seen_ranges.append(range_header)
+        headers = {'ETag': ETAG}
+        if range_header and request.headers.get('If-Range') == ETAG:
+            start = int(range_header[len('bytes='):].rstrip('-'))
+            return web.Response(
+                status=206,
+                body=content[start:],
+                headers=headers,
+            )
+        return web.Response(body=content, headers=headers)
+
+    async def missing(request: web.Request) -> web.Response:
+        raise web.HTTPNotFound()
+
+    app = web.Application()
+    app.router.add_get('/file', serve)
+    app.router.add_get('/missing', missing)
+    return app
+
+
+@pytest.fixture()
+def no_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Make retries immediate."""
+    monkeypatch.setattr(downloader, 'BACKOFF_BASE', 0)
+
+
+@pytest.mark.asyncio()
+@pytest.mark.usefixtures('no_backoff')
+async def test_retry_resumes_from_partial_file(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test partial file is continued with Range request after failure."""
+    seen_ranges: list = []
+    server = await aiohttp_server(create_flaky_app(2, seen_ranges))
+    path_to_file = tmp_path / 'file.bin'
+    (tmp_path / 'file.bin.part').write_bytes(content[:1000])
+    write_validator(tmp_path / 'file.bin.part', ETAG)
+
+    async with ClientSession() as session:
+        download_result = await download_file(
+            str(server.make_url('/file')),
+            session,
+            path_to_file,
+            expected_size=len(content),
+        )
+
+    assert download_result.ok
+    assert download_result.attempts == 3
+    assert download_result.resumed_from == 1000
+    assert seen_ranges == ['bytes=1000-']
+    assert download_result.sha256 == hashlib.sha256(content).hexdigest()
+    assert path_to_file.read_bytes() == content
+    assert not (tmp_path / 'file.bin.part').exists()
+    assert not (tmp_path / 'file.bin.part.meta').exists()
+
+
+@pytest.mark.asyncio()
+@pytest.mark.parametrize(('validator', 'honor_if_range'), [
+    (None, True),
+    ('"old"', True),
+    ('"old"', False),
+])
+async def test_stale_partial_file_is_not_spliced(
+    aiohttp_server,
+    tmp_path: Path,
+    validator: str,
+    honor_if_range: bool,
+) -> None:
+    """Test partial file of changed upstream content is not continued.
+
+    Partial file without validator is dropped, other validator makes
+    server send whole file, and server ignoring If-Range is caught by
+    git blob sha check of resumed file.
+    """
+    old_content = b'A' * 1000
+    new_content = b'B' * 1000
+
+    async def serve(request: web.Request) -> web.Response:
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if range_header and (not honor_if_range or if_range == '"new"'):
+            start = int(range_header[len('bytes='):].rstrip('-'))
+            return web.Response(status=206, body=new_content[start:])
+        return web.Response(body=new_content, headers={'ETag': '"new"'})
+
+    app = web.Application()
+    app.router.add_get('/file', serve)
+    server = await aiohttp_server(app)
+    part_path = tmp_path / 'file.bin.part'
+    part_path.write_bytes(old_content[:600])
+    if validator is not None:
+        write_validator(part_path, validator, blob_sha(new_content))
+
+    async with ClientSession() as session:
+        download_result = await download_file(
+            str(server.make_url('/file')),
+            session,
+            tmp_path / 'file.bin',
+            expected_size=len(new_content),
+            expected_blob_sha=blob_sha(new_content),
+        )
+
+    assert download_result.ok
+    assert (tmp_path / 'file.bin').read_bytes() == new_content
+    assert download_result.sha256 == hashlib.sha256(new_content).hexdigest()
+
+
+@pytest.mark.asyncio()
+@pytest.mark.usefixtures('no_backoff')
+async def test_failures_are_reported_not_written(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test missing file and size mismatch give failed results."""
+    server = await aiohttp_server(create_flaky_app(0, []))
+
+    async with ClientSession() as session:
+        missing_result = await download_file(
+            str(server.make_url('/missing')),
+            session,
+            tmp_path / 'missing',
+        )
+        short_result = await download_file(
+            str(server.make_url('/file')),
+            session,
+            tmp_path / 'short',
+            expected_size=len(content) + 1,
+            max_attempts=2,
+        )
+
+    assert not missing_result.ok
+    assert missing_result.attempts == 1
+    assert missing_result.error == 'HTTP 404'
+    assert not short_result.ok
+    assert short_result.attempts == 2
+    assert not (tmp_path / 'missing').exists()
+    assert not (tmp_path / 'short').exists()
+
+
+@pytest.mark.asyncio()
+async def test_hashes_computed_and_blob_sha_verified(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test extra hashes in one pass and git blob id mismatch flagged."""
+    server = await aiohttp_server(create_flaky_app(0, []))
+    hash_options = HashOptions(('md5',), verify_blob=True)
+
+    async with ClientSession() as session:
+        good_result = await download_file(
+            str(server.make_url('/file')),
+            session,
+            tmp_path / 'good',
+            expected_size=len(content),
+            hash_options=hash_options,
+            expected_blob_sha=blob_sha(content),
+        )
+        bad_result = await download_file(
+            str(server.make_url('/file')),
+            session,
+            tmp_path / 'bad',
+            expected_size=len(content),
+            hash_options=hash_options,
+            expected_blob_sha='0' * 40,
+        )
+
+    assert good_result.ok
+    assert good_result.hashes == {
+        SHA256: hashlib.sha256(content).hexdigest(),
+        'md5': hashlib.md5(content).hexdigest(),  # noqa: S324
+        GIT_BLOB_SHA1: blob_sha(content),
+    }
+    assert hash_file(str(tmp_path / 'good'), ALGORITHMS)[GIT_BLOB_SHA1] == (
+        blob_sha(content)
+    )
+    assert not bad_result.ok
+    assert bad_result.blob_mismatch
+    assert bad_result.attempts == 1
+    assert not (tmp_path / 'bad').exists()
+    assert not (tmp_path / 'bad.part').exists()
+
+
+def write_validator(
+    part_path: Path,
+    validator: str,
+    expected_blob_sha: Optional[str] = None,
+) -> None:
+    """Write validator file left by earlier download of partial file."""
+    validator_path = part_path.with_name(part_path.name + '.meta')
+    validator_path.write_text(json.dumps({
+        'validator': validator,
+        'blob_sha': expected_blob_sha,
+    }))
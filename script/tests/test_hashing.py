@@ -0,0 +1,63 @@
+"""Tests for file hashing engine."""
+
+import hashlib
+from pathlib import Path
+
+import aux_utils
+import pytest
+from aux_utils import get_hash
+from hashing import INLINE, PROCESSES, THREADS, HashingEngine, choose_strategy
+
+kilobyte: int = 1024
+megabyte: int = kilobyte * kilobyte
+
+
+def test_strategy_depends_on_file_count_and_size() -> None:
+    """Test inline for little work, processes for many tiny files only."""
+    assert choose_strategy([kilobyte] * 10) == INLINE
+    assert choose_strategy([100 * megabyte]) == INLINE
+    assert choose_strategy([10 * megabyte] * 4) == THREADS
+    assert choose_strategy([kilobyte] * 100000) == PROCESSES
+    assert choose_strategy([16 * kilobyte] * 10000) == THREADS
+    assert choose_strategy([16 * kilobyte] * 200) == THREADS
+
+
+@pytest.mark.parametrize('strategy', [INLINE, THREADS, PROCESSES])
+def test_engine_hashes_with_reused_pools(
+    tmp_path: Path,
+    strategy: str,
+) -> None:
+    """Test every strategy gives same hashes and pools are reused."""
+    paths = []
+    for num in range(5):
+        path = tmp_path / str(num)
+        path.write_bytes(bytes([num]) * (num * 1000))
+        paths.append(path)
+    engine = HashingEngine(max_workers=2)
+
+    first_run = list(engine.hash_files(paths, strategy))
+    pool = engine.executor(strategy)
+    second_run = list(engine.hash_files(paths, strategy))
+    reused_pool = engine.executor(strategy)
+    engine.close()
+
+    assert first_run == second_run
+    assert reused_pool is pool
+    assert first_run[3] == (
+        paths[3],
+        hashlib.sha256(bytes([3]) * 3000).hexdigest(),
+    )
+
+
+def test_get_hash_of_memory_mapped_file(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test large files hashed through mmap match plain hashing."""
+    monkeypatch.setattr(aux_utils, 'MMAP_THRESHOLD', 10)
+    path = tmp_path / 'big'
+    path.write_bytes(b'0123456789' * 1000)
+
+    assert get_hash(str(path), chunk_size=7) == hashlib.sha256(
+        b'0123456789' * 1000,
+    ).hexdigest()
@@ -0,0 +1,75 @@
+"""Tests for conditional discovery requests."""
+
+from collections import Counter
+from pathlib import Path
+
+import pytest
+from aiohttp import ClientSession
+from benchmarks.gitea_stub import CONTENTS_PATH, create_repo_app
+from http_cache import CacheEntry, HttpCache
+from link_extractor import TraversalStats, walk_repo
+
+repo_files: dict = {
+    'README.md': b'readme',
+    'src/app.py': b'print(1)\n',
+    'src/lib/util.py': b'x = 2\n',
+    'docs/index.md': b'# docs\n',
+}
+
+
+async def discover(url: str, cache: HttpCache) -> tuple:
+    """Return sorted paths found and traversal stats."""
+    stats = TraversalStats()
+    async with ClientSession() as session:
+        paths = sorted([
+            repo_file.path
+            async for repo_file in walk_repo(
+                url,
+                session,
+                stats=stats,
+                cache=cache,
+            )
+        ])
+    return paths, stats
+
+
+@pytest.mark.asyncio()
+async def test_unchanged_subtrees_are_not_requested(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test repeat walk sends one conditional request for unchanged repo.
+
+    Changed subtree is listed again, unchanged siblings come from cache.
+    """
+    files = dict(repo_files)
+    hits: Counter = Counter()
+    server = await aiohttp_server(create_repo_app(files, hits))
+    url = str(server.make_url(CONTENTS_PATH))
+    cache = HttpCache(str(tmp_path))
+
+    first_paths, first_stats = await discover(url, cache)
+    second_paths, second_stats = await discover(url, cache)
+    files['src/lib/new.py'] = b'y = 3\n'
+    third_paths, third_stats = await discover(url, cache)
+
+    assert first_paths == second_paths == sorted(repo_files)
+    assert first_stats.requests == 4
+    assert (second_stats.requests, second_stats.not_modified) == (1, 1)
+    assert second_stats.cached == 3
+    assert 'src/lib/new.py' in third_paths
+    assert third_stats.requests == 3
+    assert third_stats.cached == 1
+    assert hits['not_modified'] == 1
+
+
+def test_cache_entry_round_trip(tmp_path: Path) -> None:
+    """Test entries are keyed by URL with query params."""
+    cache = HttpCache(str(tmp_path))
+    cache_entry = CacheEntry([{'a': 1}], '"tag"', None, 'abc')
+
+    cache.put('http://host/api', cache_entry, {'page': 1})
+
+    assert cache.get('http://host/api', {'page': 1}) == cache_entry
+    assert cache.get('http://host/api', {'page': 2}) is None
+    assert cache_entry.conditional_headers() == {'If-None-Match': '"tag"'}
@@ -0,0 +1,56 @@
+"""Tests for adaptive download limiter."""
+
+import asyncio
+
+import pytest
+from limiter import AdaptiveLimiter, parse_retry_after
+
+
+def test_limit_grows_and_backs_off() -> None:
+    """Test additive increase on success and halving on throttling."""
+    limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=16)
+
+    for _ in range(8):
+        limiter.record_success(latency=0.01)
+    grown_limit = limiter.limit
+    limiter.record_failure(429)
+
+    assert int(grown_limit) == 5
+    assert limiter.limit == pytest.approx(grown_limit / 2)
+    assert limiter.snapshot()['failed'] == 1
+
+
+def test_fixed_limit_ignores_throttling() -> None:
+    """Test limiter with equal bounds works as plain semaphore."""
+    limiter = AdaptiveLimiter(initial=3, min_limit=3, max_limit=3)
+
+    limiter.record_failure(503)
+    limiter.record_success(latency=0.01)
+
+    assert limiter.limit == 3
+
+
+def test_parse_retry_after() -> None:
+    """Test Retry-After given in seconds and as HTTP date."""
+    assert parse_retry_after({'Retry-After': '7'}) == 7
+    past_date = 'Wed, 21 Oct 2015 07:28:00 GMT'
+    assert parse_retry_after({'Retry-After': past_date}) == 0
+    assert parse_retry_after({}) is None
+
+
+@pytest.mark.asyncio()
+async def test_acquire_waits_for_slot_and_retry_after() -> None:
+    """Test acquire blocks at limit and while Retry-After pause lasts."""
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=1)
+    await limiter.acquire()
+    waiting = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+
+    limiter.record_failure(429, retry_after=0.05)
+    limiter.release()
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+
+    await asyncio.wait_for(waiting, timeout=1)
+    assert limiter.in_flight == 1
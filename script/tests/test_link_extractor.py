@@ -0,0 +1,164 @@
+"""Tests for repo file discovery."""
+
+import asyncio
+from collections import Counter
+from typing import Callable
+
+import pytest
+from aiohttp import ClientSession, web
+from benchmarks.gitea_stub import CONTENTS_PATH, REPO_API_PATH, create_repo_app
+from client_config import ClientConfig
+from link_extractor import (
+    SYMLINK_MODE,
+    TraversalStats,
+    traverse_repo,
+    walk_repo,
+    walk_repo_tree,
+)
+
+repo_files: dict = {
+    'README.md': b'readme',
+    'a/one.txt': b'one',
+    'a/b/two.txt': b'two',
+    'a/b/c/three.txt': b'three',
+    'd/four.txt': b'four',
+    'd/e/five.txt': b'five',
+}
+
+
+@pytest.mark.asyncio()
+async def test_traverse_repo_collects_all_links(aiohttp_server) -> None:
+    """Test concurrent traversal returns every file link of the tree."""
+    server = await aiohttp_server(create_repo_app(repo_files))
+
+    async with ClientSession() as session:
+        links, stats = await traverse_repo(
+            str(server.make_url(CONTENTS_PATH)),
+            session,
+            concur_dir_num=3,
+        )
+
+    assert sorted(link.partition('/master/')[2] for link in links) == sorted(
+        repo_files,
+    )
+    assert stats.requests == 6
+    assert stats.depth == 4
+    assert stats.errors == 0
+
+
+@pytest.mark.asyncio()
+async def test_tree_backend_matches_contents_walk(aiohttp_server) -> None:
+    """Test paged git trees listing yields same files as contents walk."""
+    hits: Counter = Counter()
+    app = create_repo_app(repo_files, hits, tree_page_size=4)
+    server = await aiohttp_server(app)
+    url = str(server.make_url(CONTENTS_PATH))
+
+    async with ClientSession() as session:
+        contents_files = [
+            (repo_file.path, repo_file.sha)
+            async for repo_file in walk_repo(url, session)
+        ]
+        stats = TraversalStats()
+        tree_files = [
+            (repo_file.path, repo_file.sha)
+            async for repo_file in walk_repo_tree(url, session, 2, stats)
+        ]
+
+    assert sorted(tree_files) == sorted(contents_files)
+    assert hits['trees'] == 3
+    assert stats.requests == 4
+    assert stats.depth == 4
+
+
+@pytest.mark.asyncio()
+async def test_truncated_tree_falls_back_to_contents(aiohttp_server) -> None:
+    """Test files missing from unpaged truncated tree are walked once."""
+    hits: Counter = Counter()
+    app = create_repo_app(repo_files, hits, tree_page_size=4, paged=False)
+    server = await aiohttp_server(app)
+
+    async with ClientSession() as session:
+        tree_files = [
+            repo_file.path
+            async for repo_file in walk_repo_tree(
+                str(server.make_url(CONTENTS_PATH)),
+                session,
+            )
+        ]
+
+    assert sorted(tree_files) == sorted(repo_files)
+    assert hits['trees'] == 1
+    assert hits['contents'] == 6
+
+
+@pytest.mark.asyncio()
+async def test_listing_timeout_is_counted_as_error(aiohttp_server) -> None:
+    """Test directory listing hitting total timeout does not stop walk."""
+    app = create_repo_app(repo_files)
+
+    @web.middleware
+    async def slow_dir(  # noqa: WPS430
+        request: web.Request,
+        handler: Callable,
+    ) -> web.Response:
+        if request.path.endswith('/contents/d'):
+            await asyncio.sleep(1)
+        return await handler(request)
+
+    app.middlewares.append(slow_dir)
+    server = await aiohttp_server(app)
+
+    async with ClientConfig(total_timeout=0.2).make_session() as session:
+        links, stats = await traverse_repo(
+            str(server.make_url(CONTENTS_PATH)),
+            session,
+        )
+
+    assert stats.errors == 1
+    assert len(links) == 4
+
+
+async def special_listing(request: web.Request) -> web.Response:
+    """Serve directory listing with file, symlink and submodule."""
+    return web.json_response([
+        {'path': 'a.txt', 'type': 'file', 'download_url': 'http://x/a.txt'},
+        {'path': 'link', 'type': 'symlink', 'download_url': None},
+        {'path': 'module', 'type': 'submodule', 'download_url': None},
+    ])
+
+
+async def special_tree(request: web.Request) -> web.Response:
+    """Serve git tree with file, symlink and submodule."""
+    return web.json_response({'truncated': False, 'tree': [
+        {'path': 'a.txt', 'type': 'blob', 'mode': '100644'},
+        {'path': 'link', 'type': 'blob', 'mode': SYMLINK_MODE},
+        {'path': 'module', 'type': 'commit', 'mode': '160000'},
+    ]})
+
+
+@pytest.mark.asyncio()
+@pytest.mark.parametrize('walk', [walk_repo, walk_repo_tree])
+async def test_symlinks_and_submodules_are_skipped(
+    aiohttp_server,
+    walk: Callable,
+) -> None:
+    """Test entries other than files and directories do not stop walk."""
+    app = web.Application()
+    app.router.add_get(CONTENTS_PATH, special_listing)
+    app.router.add_get(REPO_API_PATH + '/git/trees/master', special_tree)
+    server = await aiohttp_server(app)
+    stats = TraversalStats()
+
+    async with ClientSession() as session:
+        paths = [
+            repo_file.path
+            async for repo_file in walk(
+                '{0}?ref=master'.format(server.make_url(CONTENTS_PATH)),
+                session,
+                stats=stats,
+            )
+        ]
+
+    assert paths == ['a.txt']
+    assert stats.skipped == 2
@@ -0,0 +1,52 @@
+"""Tests for queued logging and hash sink."""
+
+import io
+import json
+import logging
+import sys
+
+import pytest
+from loggers import (
+    configure_logging,
+    file_logger,
+    flush_logging,
+    hash_logger,
+    log_hash,
+    logger,
+)
+
+
+@pytest.fixture()
+def hash_stream() -> io.StringIO:
+    """Send hashes to string buffer, restore defaults afterwards."""
+    stream = io.StringIO()
+    configure_logging(logging.INFO, logging.WARNING, stream)
+    yield stream
+    configure_logging(hash_stream=sys.stdout)
+
+
+def test_hashes_go_to_json_sink(hash_stream: io.StringIO) -> None:
+    """Test hash records are JSON lines kept out of main log."""
+    log_hash('dir/file.txt', {'sha256': 'abc', 'md5': 'def'})
+    log_hash('other.txt', {'sha256': '123'}, cached=True)
+    flush_logging()
+
+    lines = hash_stream.getvalue().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {
+            'path': 'dir/file.txt',
+            'sha256': 'abc',
+            'md5': 'def',
+            'cached': False,
+        },
+        {'path': 'other.txt', 'sha256': '123', 'cached': True},
+    ]
+    assert not hash_logger.propagate
+
+
+@pytest.mark.usefixtures('hash_stream')
+def test_per_file_level_is_separate() -> None:
+    """Test per-file messages follow their own level."""
+    assert logger.isEnabledFor(logging.INFO)
+    assert not file_logger.isEnabledFor(logging.INFO)
+    assert file_logger.isEnabledFor(logging.WARNING)
@@ -0,0 +1,65 @@
+"""Tests for download pipeline."""
+
+import hashlib
+from pathlib import Path
+
+import pytest
+from aiohttp import ClientSession
+from benchmarks.gitea_stub import CONTENTS_PATH, create_repo_app
+from downloader import download_file
+from link_extractor import walk_repo
+from main import run_tasks
+
+repo_files: dict = {
+    'README.md': b'readme',
+    'src/app.py': b'print(1)\n',
+    'src/lib/util.py': b'x = 2\n',
+}
+
+
+@pytest.mark.asyncio()
+async def test_run_tasks_consumes_discovery_stream(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test downloads are fed straight from repo traversal."""
+    server = await aiohttp_server(create_repo_app(repo_files))
+
+    async with ClientSession() as session:
+        stream = walk_repo(str(server.make_url(CONTENTS_PATH)), session)
+        results: list = []
+        summary = await run_tasks(
+            stream,
+            str(tmp_path),
+            session,
+            2,
+            on_result=results.append,
+        )
+
+    assert (tmp_path / 'src/lib/util.py').read_bytes() == b'x = 2\n'
+    assert summary.downloaded == len(results) == 3
+    assert summary.bytes_downloaded == 21
+    assert len([path for path in tmp_path.rglob('*') if path.is_file()]) == 3
+
+
+@pytest.mark.asyncio()
+async def test_download_file_hashes_while_streaming(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test download returns sha256 of content streamed to disk."""
+    server = await aiohttp_server(create_repo_app(repo_files))
+    url = str(server.make_url('/owner/repo/raw/branch/master/src/app.py'))
+    path_to_file = tmp_path / 'app.py'
+
+    async with ClientSession() as session:
+        download_result = await download_file(
+            url,
+            session,
+            path_to_file,
+            chunk_size=4,
+        )
+
+    assert path_to_file.read_bytes() == repo_files['src/app.py']
+    assert download_result.ok
+    assert download_result.sha256 == hashlib.sha256(b'print(1)\n').hexdigest()
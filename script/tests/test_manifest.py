@@ -0,0 +1,96 @@
+"""Tests for streamed hash manifests and tree verification."""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pytest
+from benchmarks.gitea_stub import CONTENTS_PATH, blob_sha, create_repo_app
+from main import main
+from manifest import ManifestWriter, read_manifest, verify_tree
+
+repo_files: dict = {'a.txt': b'a', 'dir/b.txt': b'bb'}
+
+
+async def sync_with_manifest(url: str, tmp_path: Path) -> list:
+    """Sync repo to mirror, return records of its JSON Lines manifest."""
+    checksum_path = tmp_path / 'files.sha256'
+    jsonl_path = tmp_path / 'files.jsonl'
+    with ManifestWriter(str(checksum_path), str(jsonl_path)) as manifest:
+        await main(url, mirror_dir=str(tmp_path / 'mirror'), manifest=manifest)
+    return sorted(
+        read_manifest(str(jsonl_path)),
+        key=lambda record: record['path'],
+    )
+
+
+@pytest.mark.asyncio()
+async def test_manifest_lists_downloaded_and_cached_files(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test every file is written, unchanged ones as cached by index."""
+    server = await aiohttp_server(create_repo_app(repo_files))
+    url = str(server.make_url(CONTENTS_PATH))
+
+    first_records = await sync_with_manifest(url, tmp_path)
+    checksum_lines = (tmp_path / 'files.sha256').read_text().splitlines()
+    second_records = await sync_with_manifest(url, tmp_path)
+
+    assert set(checksum_lines) == {
+        '{0}  a.txt'.format(hashlib.sha256(b'a').hexdigest()),
+        '{0}  dir/b.txt'.format(hashlib.sha256(b'bb').hexdigest()),
+    }
+    assert first_records[1]['sha'] == blob_sha(b'bb')
+    assert first_records[1]['size'] == 2
+    assert first_records[1]['source'] == 'download'
+    assert first_records[1]['download_seconds'] >= 0
+    assert [record['source'] for record in second_records] == [
+        'index',
+        'index',
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_verify_rehashes_suspect_files_only(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test files with recorded size and mtime are trusted."""
+    server = await aiohttp_server(create_repo_app(repo_files))
+    records = await sync_with_manifest(
+        str(server.make_url(CONTENTS_PATH)),
+        tmp_path,
+    )
+    mirror = tmp_path / 'mirror'
+
+    assert verify_tree(str(mirror), records).as_dict() == {
+        'checked': 2,
+        'rehashed': 0,
+        'missing': 0,
+        'changed': 0,
+    }
+    (mirror / 'a.txt').write_bytes(b'x')
+    os.utime(mirror / 'dir' / 'b.txt', ns=(0, 0))
+    report = verify_tree(str(mirror), records)
+    assert report.rehashed == 2
+    assert report.changed == ['a.txt']
+    (mirror / 'dir' / 'b.txt').unlink()
+    checksums = read_manifest(str(tmp_path / 'files.sha256'))
+    report = verify_tree(str(mirror), checksums)
+    assert report.missing == ['dir/b.txt']
+    assert report.rehashed == 1
+
+
+def test_checksum_file_is_parsed(tmp_path: Path) -> None:
+    """Test sha256sum text and binary lines are read, others rejected."""
+    manifest_path = tmp_path / 'files.sha256'
+    manifest_path.write_text('{0}  a b.txt\n{0} *c.bin\n'.format('0' * 64))
+
+    assert [record['path'] for record in read_manifest(
+        str(manifest_path),
+    )] == ['a b.txt', 'c.bin']
+    manifest_path.write_text(json.dumps({'path': 'a'}) + '\nbroken\n')
+    with pytest.raises(ValueError, match='Bad manifest line'):
+        read_manifest(str(manifest_path))
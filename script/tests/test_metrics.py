@@ -0,0 +1,97 @@
+"""Tests for pipeline metrics and exporters."""
+
+import json
+import socket
+from pathlib import Path
+
+import pytest
+from benchmarks.gitea_stub import CONTENTS_PATH, create_repo_app
+from client_config import ClientConfig
+from main import main, parse_args
+from metrics import (
+    Histogram,
+    JsonExporter,
+    MetricsRegistry,
+    PrometheusExporter,
+    StatsdExporter,
+    registry,
+    to_prometheus,
+)
+
+
+def test_histogram_percentiles() -> None:
+    """Test percentiles stay within observed range and buckets."""
+    histogram = Histogram((1, 2, 4, 8))
+    for observed in range(1, 101):
+        histogram.observe(observed / 10)
+
+    summary = histogram.summary()
+
+    assert summary['count'] == 100
+    assert summary['min'] == 0.1
+    assert summary['max'] == 10
+    assert 4 <= summary['p50'] <= 8
+    assert 8 <= summary['p99'] <= 10
+    assert summary['p50'] <= summary['p90'] <= summary['p99']
+
+
+def test_prometheus_and_statsd_export() -> None:
+    """Test text exposition format and UDP packets."""
+    metrics = MetricsRegistry()
+    metrics.increment('retries', 2)
+    metrics.observe('ttfb_seconds', 0.01)
+
+    text = to_prometheus(metrics)
+
+    assert 'radium_retries_total 2' in text
+    assert 'radium_ttfb_seconds_bucket{le="+Inf"} 1' in text
+    assert 'radium_ttfb_seconds_count 1' in text
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        sock.settimeout(1)
+        StatsdExporter(*sock.getsockname()).export(metrics)
+        packet = sock.recv(4096).decode()
+    assert 'radium.retries:2|c' in packet.splitlines()
+    assert 'radium.ttfb_seconds.count:1|g' in packet.splitlines()
+
+
+def test_statsd_address_is_checked_on_parse() -> None:
+    """Test StatsD port defaults to 8125 and bad address is rejected."""
+    assert parse_args(['--statsd', 'localhost']).statsd == (
+        'localhost',
+        8125,
+    )
+    assert parse_args(['--statsd', 'stats:9125']).statsd == ('stats', 9125)
+    with pytest.raises(SystemExit):
+        parse_args(['--statsd', 'stats:port'])
+
+
+@pytest.mark.asyncio()
+async def test_main_reports_metrics(aiohttp_server, tmp_path: Path) -> None:
+    """Test run records tracing, download and limiter metrics."""
+    repo_files = {'a.txt': b'a' * 100, 'dir/b.txt': b'b' * 50}
+    server = await aiohttp_server(create_repo_app(repo_files))
+    json_path = tmp_path / 'metrics.json'
+    prometheus_path = tmp_path / 'metrics.prom'
+
+    await main(
+        str(server.make_url(CONTENTS_PATH)),
+        ClientConfig(concurrency=2),
+        exporters=[
+            JsonExporter(str(json_path)),
+            PrometheusExporter(str(prometheus_path)),
+        ],
+    )
+
+    report = json.loads(json_path.read_text())
+    assert report == registry.report()
+    assert report['counters']['files_downloaded'] == 2
+    assert report['counters']['bytes_received'] == 150
+    assert report['counters']['requests'] == 4
+    histograms = report['histograms']
+    assert histograms['ttfb_seconds']['count'] == 4
+    assert histograms['connect_seconds']['count'] >= 1
+    assert histograms['limiter_wait_seconds']['count'] == 2
+    assert histograms['file_bytes']['max'] == 100
+    assert set(report['time_split']) == {'network', 'disk_write', 'hash'}
+    assert 'radium_download_seconds_count 2' in prometheus_path.read_text()
@@ -0,0 +1,55 @@
+"""Tests for worker pool scheduler."""
+
+import asyncio
+from typing import AsyncIterator
+
+import pytest
+from scheduler import run_pool
+
+
+async def numbers(count: int) -> AsyncIterator[int]:
+    """Yield given number of jobs."""
+    for num in range(count):
+        yield num
+
+
+@pytest.mark.asyncio()
+async def test_pool_keeps_task_count_constant() -> None:
+    """Test many jobs run on fixed number of tasks."""
+    handled: list = []
+    task_counts: list = []
+
+    async def handle(job: int) -> None:
+        task_counts.append(len(asyncio.all_tasks()))
+        await asyncio.sleep(0)
+        handled.append(job)
+
+    job_count = await run_pool(numbers(2000), handle, worker_num=4)
+
+    assert job_count == 2000
+    assert sorted(handled) == list(range(2000))
+    assert max(task_counts) <= 6
+
+
+@pytest.mark.asyncio()
+async def test_pool_stops_on_worker_error_and_cancel() -> None:
+    """Test worker error and cancellation leave no running tasks."""
+    tasks_before = asyncio.all_tasks()
+
+    async def fail(job: int) -> None:
+        if job == 10:
+            raise ValueError('bad job')
+
+    with pytest.raises(ValueError, match='bad job'):
+        await run_pool(numbers(100), fail, worker_num=3)
+
+    async def hang(job: int) -> None:
+        await asyncio.sleep(60)
+
+    pool = asyncio.ensure_future(run_pool(numbers(100), hang, worker_num=3))
+    await asyncio.sleep(0.01)
+    pool.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await pool
+
+    assert asyncio.all_tasks() == tasks_before
@@ -0,0 +1,37 @@
+"""Tests for incremental mirror sync."""
+
+from collections import Counter
+from pathlib import Path
+
+import pytest
+from benchmarks.gitea_stub import CONTENTS_PATH, create_repo_app
+from main import main
+from sync_index import SyncIndex
+
+
+@pytest.mark.asyncio()
+async def test_mirror_downloads_changed_files_only(
+    aiohttp_server,
+    tmp_path: Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """Test second mirror run skips files with unchanged blob sha."""
+    files = {'a.txt': b'a', 'dir/b.txt': b'b', 'dir/c.txt': b'c'}
+    hits: Counter = Counter()
+    server = await aiohttp_server(create_repo_app(files, hits))
+    url = str(server.make_url(CONTENTS_PATH))
+
+    await main(url, mirror_dir=str(tmp_path))
+    files['dir/b.txt'] = b'changed'
+    del files['a.txt']  # noqa: WPS420
+    caplog.clear()
+    await main(url, mirror_dir=str(tmp_path))
+
+    assert hits['raw'] == 4
+    assert '2 urls collected, 1 up to date in index.' in caplog.messages
+    assert (tmp_path / 'dir' / 'b.txt').read_bytes() == b'changed'
+    assert not (tmp_path / 'a.txt').exists()
+    assert sorted(SyncIndex.load(str(tmp_path)).entries) == [
+        'dir/b.txt',
+        'dir/c.txt',
+    ]
@@ -0,0 +1,146 @@
+"""Tests for watcher keeping mirrors up to date."""
+
+import asyncio
+import hashlib
+import hmac
+import json
+from collections import Counter
+from pathlib import Path
+
+import pytest
+from batch import BatchEntry, BatchSync
+from benchmarks.gitea_stub import CONTENTS_PATH, create_repo_app
+from client_config import ClientConfig
+from watcher import WEBHOOK_PATH, Watcher, entry_matches
+
+PUSH_PAYLOAD: dict = {
+    'ref': 'refs/heads/master',
+    'repository': {'full_name': 'owner/repo', 'default_branch': 'master'},
+}
+
+
+def test_push_matches_entry_ref() -> None:
+    """Test push to default branch matches entries following it only."""
+    url = 'https://git.example.com/api/v1/repos/owner/repo/contents/'
+
+    assert entry_matches(BatchEntry(url, 'repo'), PUSH_PAYLOAD)
+    assert entry_matches(BatchEntry(url, 'repo', 'master'), PUSH_PAYLOAD)
+    assert not entry_matches(BatchEntry(url, 'repo', 'dev'), PUSH_PAYLOAD)
+    other_repo = {**PUSH_PAYLOAD, 'repository': {'full_name': 'owner/x'}}
+    assert not entry_matches(BatchEntry(url, 'repo'), other_repo)
+
+
+@pytest.mark.asyncio()
+async def test_webhook_syncs_only_changed_files(
+    aiohttp_server,
+    aiohttp_client,
+    tmp_path: Path,
+) -> None:
+    """Test push webhook swaps in changed files and drops deleted ones."""
+    files = {'a.txt': b'a', 'b.txt': b'b', 'dir/c.txt': b'c'}
+    hits: Counter = Counter()
+    server = await aiohttp_server(create_repo_app(files, hits))
+    url = str(server.make_url(CONTENTS_PATH))
+    mirror = tmp_path / 'mirror' / 'repo'
+
+    async with BatchSync(
+        ClientConfig(),
+        str(tmp_path / 'out'),
+        mirror_root=str(tmp_path / 'mirror'),
+    ) as batch:
+        watcher = Watcher(batch, [BatchEntry(url, 'repo')], None, secret='s')
+        client = await aiohttp_client(watcher.make_app())
+        run_task = asyncio.create_task(watcher.run(max_cycles=2))
+        await wait_for_cycles(watcher, 1)
+        files['a.txt'] = b'changed'
+        files.pop('b.txt')
+        body = json.dumps(PUSH_PAYLOAD).encode()
+        signature = hmac.new(b's', body, hashlib.sha256).hexdigest()
+
+        rejected = await client.post(WEBHOOK_PATH, data=body)
+        response = await client.post(
+            WEBHOOK_PATH,
+            data=body,
+            headers={'X-Gitea-Signature': signature},
+        )
+        await asyncio.wait_for(run_task, timeout=5)
+
+    assert rejected.status == 403
+    assert response.status == 202
+    assert await response.json() == {'queued': ['repo']}
+    assert hits['raw'] == 4
+    assert (mirror / 'a.txt').read_bytes() == b'changed'
+    assert not (mirror / 'b.txt').exists()
+    assert (tmp_path / 'out' / 'repo.sha256').read_text().splitlines() == [
+        '{0}  a.txt'.format(hashlib.sha256(b'changed').hexdigest()),
+        '{0}  dir/c.txt'.format(hashlib.sha256(b'c').hexdigest()),
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_poll_without_changes_downloads_nothing(
+    aiohttp_server,
+    tmp_path: Path,
+) -> None:
+    """Test polls after first sync fetch listings only."""
+    hits: Counter = Counter()
+    server = await aiohttp_server(create_repo_app({'a.txt': b'a'}, hits))
+    entry = BatchEntry(str(server.make_url(CONTENTS_PATH)), 'repo')
+
+    async with BatchSync(
+        ClientConfig(),
+        str(tmp_path / 'out'),
+        mirror_root=str(tmp_path / 'mirror'),
+    ) as batch:
+        watcher = Watcher(batch, [entry], interval=0.01)
+        await asyncio.wait_for(watcher.run(max_cycles=3), timeout=5)
+
+    assert watcher.cycles == 3
+    assert hits['raw'] == 1
+    assert hits['contents'] == 3
+
+
+@pytest.mark.asyncio()
+async def test_failed_cycle_keeps_entries_due(
+    aiohttp_server,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test entries of cycle that raised are synced by next cycle."""
+    hits: Counter = Counter()
+    server = await aiohttp_server(create_repo_app({'a.txt': b'a'}, hits))
+    entry = BatchEntry(str(server.make_url(CONTENTS_PATH)), 'repo')
+    synced: list = []
+
+    async with BatchSync(
+        ClientConfig(),
+        str(tmp_path / 'out'),
+        mirror_root=str(tmp_path / 'mirror'),
+    ) as batch:
+        run_batch = batch.run
+
+        async def flaky_run(  # noqa: WPS430
+            entries: list,
+            repo_concurrency: int,
+        ) -> int:
+            synced.append([batch_entry.name for batch_entry in entries])
+            if len(synced) == 1:
+                raise RuntimeError('boom')
+            return await run_batch(entries, repo_concurrency)
+
+        monkeypatch.setattr(batch, 'run', flaky_run)
+        watcher = Watcher(batch, [entry], interval=None)
+        run_task = asyncio.create_task(watcher.run(max_cycles=2))
+        await wait_for_cycles(watcher, 1)
+        assert not run_task.done()
+        watcher.request_sync(set())
+        await asyncio.wait_for(run_task, timeout=5)
+
+    assert synced == [['repo'], ['repo']]
+    assert hits['raw'] == 1
+
+
+async def wait_for_cycles(watcher: Watcher, cycles: int) -> None:
+    """Wait until watcher finished given number of cycles."""
+    while watcher.cycles < cycles:  # noqa: WPS328
+        await asyncio.sleep(0.01)
@@ -0,0 +1,280 @@
+"""Keep mirrors of many repos up to date, polling them or on webhook."""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+from typing import Optional
+
+from aiohttp import web
+from batch import (
+    BUDGET,
+    REPO_CONCURRENCY,
+    BatchEntry,
+    BatchSync,
+    load_manifest,
+    make_parser,
+    options_from_args,
+)
+from client_config import ClientConfig
+from link_extractor import parse_contents_url
+from loggers import configure_logging, flush_logging, logger
+from main import client_config_from_args
+from metrics import registry
+from yarl import URL
+
+INTERVAL: float = 300
+WEBHOOK_PATH: str = '/hook'
+WEBHOOK_HOST: str = '127.0.0.1'
+SIGNATURE_HEADER: str = 'X-Gitea-Signature'
+REF_PREFIXES: tuple = ('refs/heads/', 'refs/tags/')
+
+
+def verify_signature(body: bytes, secret: str, signature: str) -> bool:
+    """Return True if signature is HMAC-SHA256 of body keyed by secret."""
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def push_ref(ref: str) -> str:
+    """Return branch or tag name of full git ref."""
+    for prefix in REF_PREFIXES:
+        if ref.startswith(prefix):
+            return ref[len(prefix):]
+    return ref
+
+
+def entry_matches(batch_entry: BatchEntry, payload: dict) -> bool:
+    """Return True if push event described by payload changes entry.
+
+    Entry without ref follows default branch of repo.
+    """
+    repository = payload.get('repository') or {}
+    location = parse_contents_url(batch_entry.url)
+    full_name = '/'.join(URL(location.api_url).parts[-2:])
+    if repository.get('full_name') != full_name:
+        return False
+    pushed_ref = push_ref(payload.get('ref') or '')
+    entry_ref = batch_entry.ref or location.ref
+    if entry_ref is None:
+        default_branch = repository.get('default_branch')
+        return default_branch is None or pushed_ref == default_branch
+    return pushed_ref == entry_ref
+
+
+class Watcher:
+    """Sync entries repeatedly with sessions and limiters kept open.
+
+    Every entry is synced on start and then after every interval, push
+    webhook syncs just entries it names at once. Requests coming during
+    cycle are merged and served by next cycle. Mirrors are updated by
+    delta against their index, every changed file is swapped in by its
+    own os.replace, so mirror is not replaced as a whole.
+    """
+
+    def __init__(
+        self,
+        batch: BatchSync,
+        entries: list,
+        interval: Optional[float] = INTERVAL,
+        repo_concurrency: int = REPO_CONCURRENCY,
+        secret: Optional[str] = None,
+    ) -> None:
+        """Prepare watcher of given entries, None interval means no polls."""
+        self.batch = batch
+        self.entries = entries
+        self.interval = interval
+        self.repo_concurrency = repo_concurrency
+        self.secret = secret
+        self.cycles = 0
+        self._due = {batch_entry.name for batch_entry in entries}
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def request_sync(self, names: Optional[set] = None) -> None:
+        """Schedule sync of named entries, all if no names are given."""
+        if names is None:
+            names = {batch_entry.name for batch_entry in self.entries}
+        self._due.update(names)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def handle_hook(self, request: web.Request) -> web.Response:
+        """Schedule sync of entries changed by pushed Gitea event."""
+        body = await request.read()
+        if self.secret is not None:
+            signature = request.headers.get(SIGNATURE_HEADER, '')
+            if not verify_signature(body, self.secret, signature):
+                logger.warning('Webhook with bad signature rejected.')
+                raise web.HTTPForbidden()
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise web.HTTPBadRequest(text='Payload is not JSON.')
+        if not isinstance(payload, dict):
+            raise web.HTTPBadRequest(text='Payload is not JSON object.')
+        names = {
+            batch_entry.name
+            for batch_entry in self.entries
+            if entry_matches(batch_entry, payload)
+        }
+        if names:
+            msg = 'Webhook queued: {0}'.format(', '.join(sorted(names)))
+            logger.info(msg)
+            self.request_sync(names)
+        return web.json_response({'queued': sorted(names)}, status=202)
+
+    def make_app(self) -> web.Application:
+        """Return web app receiving push webhooks."""
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, self.handle_hook)
+        return app
+
+    async def cycle(self) -> bool:
+        """Sync every entry scheduled so far, return False on failure.
+
+        Entries of failed cycle stay scheduled.
+        """
+        due, self._due = self._due, set()
+        entries = [
+            batch_entry
+            for batch_entry in self.entries
+            if batch_entry.name in due
+        ]
+        self.batch.failed.clear()
+        started = time.perf_counter()
+        try:
+            repo_count = await self.batch.run(entries, self.repo_concurrency)
+        except Exception as err:
+            self._due.update(due)
+            self.cycles += 1
+            msg = 'Cycle {0} failed, {1} repos kept due: {2!r}'.format(
+                self.cycles,
+                len(due),
+                err,
+            )
+            logger.error(msg)
+            return False
+        elapsed = time.perf_counter() - started
+        registry.observe('cycle_seconds', elapsed)
+        self.cycles += 1
+        msg = 'Cycle {0}: {1} repos synced in {2:.2f}s, {3} failed.'.format(
+            self.cycles,
+            repo_count,
+            elapsed,
+            len(self.batch.failed),
+        )
+        logger.info(msg)
+        return True
+
+    async def run(self, max_cycles: Optional[int] = None) -> None:
+        """Sync entries when due, forever or for given number of cycles.
+
+        After failed cycle next one waits for interval or webhook.
+        """
+        self._wakeup = asyncio.Event()
+        failed = False
+        while max_cycles is None or self.cycles < max_cycles:
+            if self._due and not failed:
+                failed = not await self.cycle()
+                continue
+            failed = False
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                self.request_sync()
+
+
+async def main(
+    entries: list,
+    output_dir: str,
+    config: Optional[ClientConfig] = None,
+    budget: int = BUDGET,
+    repo_concurrency: int = REPO_CONCURRENCY,
+    interval: Optional[float] = INTERVAL,
+    webhook_port: Optional[int] = None,
+    webhook_host: str = WEBHOOK_HOST,
+    secret: Optional[str] = None,
+    **options: object,
+) -> None:
+    """Watch entries until cancelled, serving webhook if port is given.
+
+    Other options are passed to BatchSync.
+    """
+    if config is None:
+        config = ClientConfig()
+    async with BatchSync(config, output_dir, budget, **options) as batch:
+        watcher = Watcher(batch, entries, interval, repo_concurrency, secret)
+        runner = None
+        if webhook_port is not None:
+            runner = web.AppRunner(watcher.make_app())
+            await runner.setup()
+            await web.TCPSite(runner, webhook_host, webhook_port).start()
+            msg = 'Listening for webhooks on http://{0}:{1}{2}'.format(
+                webhook_host,
+                webhook_port,
+                WEBHOOK_PATH,
+            )
+            logger.info(msg)
+        try:
+            await watcher.run()
+        finally:
+            if runner is not None:
+                await runner.cleanup()
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    """Parse command line arguments, mirror root is required."""
+    parser = make_parser(__doc__)
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=INTERVAL,
+        help='seconds between polls, 0 syncs on webhook only',
+    )
+    parser.add_argument(
+        '--webhook-port',
+        type=int,
+        help='serve push webhook at {0} on given port'.format(WEBHOOK_PATH),
+    )
+    parser.add_argument(
+        '--webhook-host',
+        default=WEBHOOK_HOST,
+        help='address webhook listens on',
+    )
+    parser.add_argument(
+        '--webhook-secret',
+        help='reject webhooks not signed with given secret',
+    )
+    args = parser.parse_args(argv)
+    if args.mirror_root is None:
+        parser.error('--mirror-root is required to keep mirrors updated')
+    if not args.interval and args.webhook_port is None:
+        parser.error('--interval 0 needs --webhook-port')
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    configure_logging(getattr(logging, args.log_level), hash_stream=None)
+    try:
+        asyncio.run(main(
+            load_manifest(args.manifest),
+            args.output,
+            client_config_from_args(args),
+            args.budget,
+            args.repo_concurrency,
+            args.interval or None,
+            args.webhook_port,
+            args.webhook_host,
+            args.webhook_secret,
+            **options_from_args(args),
+        ))
+    except KeyboardInterrupt:
+        logger.warning('Interrupted.')
+        raise SystemExit(130)
+    finally:
+        flush_logging()